@@ -0,0 +1,61 @@
+'''
+Time the diet engine on a database of 1000 foods built by scaling the
+amounts of the saved food-details page: loading the matrix (from the
+database, from the Arrow cache, from memory), one report and the scoring
+of batches of random meal plans of 8 foods.
+
+    python3 benchmarks/bench_diet.py
+'''
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import diet
+from writers import SQLiteWriter
+from bench_parse import synthetic_batch, write_batch
+
+FOODS = 1000
+PLANS = 10000
+FOODS_PER_PLAN = 8
+
+def elapsed_ms(function):
+    start = perf_counter()
+    result = function()
+    return (perf_counter() - start) * 1000, result
+
+def main():
+    normalized = synthetic_batch(FOODS, seed=0)
+    rng = np.random.default_rng(1)
+
+    with tempfile.TemporaryDirectory() as folder_name:
+        db_file = os.path.join(folder_name, 'food_components.db')
+        write_batch(normalized, SQLiteWriter('sqlite:///' + db_file, batch_size=10000))
+
+        for source in ('database', 'Arrow cache', 'memory'):
+            if source != 'memory':
+                diet._diets.clear()
+            elapsed, engine = elapsed_ms(lambda: diet.Diet.load(db_file))
+            print(f'load from {source:<12}{elapsed:>10.2f} ms')
+        print(f'{len(engine.foods)} foods x {len(engine.columns)} nutrients\n')
+
+        plan = {f'food {i}': 100.0 for i in range(FOODS_PER_PLAN)}
+        elapsed, report = elapsed_ms(lambda: engine.report(plan))
+        print(f'report of one plan      {elapsed:>10.2f} ms')
+
+        plans = [
+            {engine.foods[i]: float(grams) for i, grams in zip(rng.choice(FOODS, FOODS_PER_PLAN, replace=False), rng.uniform(20, 300, FOODS_PER_PLAN))}
+            for _ in range(PLANS)
+            ]
+        targets = dict(zip(engine.names[:20], np.ones(20)))
+        elapsed, grams = elapsed_ms(lambda: engine.grams(plans))
+        print(f'{PLANS} plans to grams  {elapsed:>10.2f} ms')
+        elapsed, totals = elapsed_ms(lambda: engine.totals(grams))
+        print(f'totals of {PLANS} plans  {elapsed:>10.2f} ms ({PLANS / elapsed * 1000:,.0f} plans/s)')
+        elapsed, scores = elapsed_ms(lambda: engine.score(grams, targets))
+        print(f'scores of {PLANS} plans  {elapsed:>10.2f} ms ({PLANS / elapsed * 1000:,.0f} plans/s)')
+
+if __name__ == '__main__':
+    main()
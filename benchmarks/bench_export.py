@@ -0,0 +1,57 @@
+'''
+Compare loading 1000 foods from food_components.csv with loading the
+food x nutrient matrix exported as Parquet and as Arrow (memory-mapped).
+The foods are built by scaling the amounts of the saved food-details page.
+
+    python3 benchmarks/bench_export.py
+'''
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+import export
+from writers import SQLiteWriter, CSVWriter
+from bench_parse import synthetic_batch, write_batch
+
+FOODS = 1000
+LOADS = 20
+
+def best_of(function, repeat=LOADS):
+    '''
+    Return the fastest of repeat calls of function, in milliseconds.
+    '''
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        timings.append(perf_counter() - start)
+    return min(timings) * 1000
+
+def main():
+    normalized = synthetic_batch(FOODS, seed=0)
+
+    with tempfile.TemporaryDirectory() as folder_name:
+        db_file = os.path.join(folder_name, 'food_components.db')
+        csv_file = os.path.join(folder_name, 'food_components.csv')
+        write_batch(normalized, SQLiteWriter('sqlite:///' + db_file, batch_size=10000), CSVWriter(csv_file, batch_size=10000))
+
+        start = perf_counter()
+        matrix = export.NutrientMatrix.from_db(db_file)
+        print(f'matrix from the db: {len(matrix.foods)} foods x {len(matrix.columns)} nutrients '
+              f'in {(perf_counter() - start) * 1000:.1f} ms')
+
+        print(f'{"file":<22}{"size KB":>10}{"load ms":>10}')
+        print(f'{"csv":<22}{os.path.getsize(csv_file) / 1024:>10.0f}{best_of(lambda: pd.read_csv(csv_file)):>10.2f}')
+        for extension in ('parquet', 'arrow'):
+            path = os.path.join(folder_name, 'food_matrix.' + extension)
+            export.write_matrix(matrix, path)
+            elapsed = best_of(lambda: export.read_matrix(path))
+            print(f'{extension:<22}{os.path.getsize(path) / 1024:>10.0f}{elapsed:>10.2f}')
+            elapsed = best_of(lambda: export.NutrientMatrix.from_arrow(export.read_matrix(path)))
+            print(f'{extension + " to NumPy":<22}{"":>10}{elapsed:>10.2f}')
+
+if __name__ == '__main__':
+    main()
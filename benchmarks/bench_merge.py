@@ -0,0 +1,60 @@
+'''
+Time the merge of many run databases into a master database, in both
+layouts. Every run holds 40 foods built from the saved food-details page,
+overlapping with the previous runs, written with the wide or the normalized
+writer; some runs report a nutrient more or less than the others.
+
+    python3 benchmarks/bench_merge.py [--runs 300]
+'''
+import os
+import sys
+import argparse
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+import merge
+from writers import SQLiteWriter, NormalizedWriter
+from bench_parse import synthetic_batch, write_batch
+
+FOODS = 40
+
+def write_runs(folder_name, runs):
+    '''
+    Write the run databases, a new run every second, and return their paths.
+    '''
+    db_files = []
+    for run in range(runs):
+        stamp = f'20240101_{run // 3600:02d}{run // 60 % 60:02d}{run % 60:02d}'
+        normalized = synthetic_batch(FOODS, first=run * 10)
+        normalized['Value'] = float(run)
+        if run % 7 == 3:
+            normalized = normalized[normalized['Nutrient'] != normalized['Nutrient'].iloc[0]]
+        if run % 5 == 1:
+            extra = normalized[normalized['Nutrient'] == normalized['Nutrient'].iloc[0]].copy()
+            extra['Nutrient'] = f'Extra {run}'
+            normalized = pd.concat([normalized, extra])
+
+        db_file = os.path.join(folder_name, f'food_components_{stamp}.db')
+        write_batch(normalized, (NormalizedWriter if run % 3 == 0 else SQLiteWriter)('sqlite:///' + db_file, batch_size=100000))
+        db_files.append(db_file)
+    return db_files
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=300)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder_name:
+        db_files = write_runs(folder_name, arguments.runs)
+        print(f'{"layout":<12}{"runs":>6}{"seconds":>10}{"MB":>8}')
+        for layout in ('wide', 'normalized'):
+            output = os.path.join(folder_name, f'master_{layout}.db')
+            start = perf_counter()
+            merge.merge(db_files, output, layout)
+            elapsed = perf_counter() - start
+            print(f'{layout:<12}{len(db_files):>6}{elapsed:>10.2f}{os.path.getsize(output) / 1024 / 1024:>8.1f}')
+
+if __name__ == '__main__':
+    main()
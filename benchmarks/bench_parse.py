@@ -0,0 +1,84 @@
+'''
+Measure how many pages per second the HTML table parser and the nutrient
+table parser handle on a saved food-details page, without any browser.
+
+    python3 benchmarks/bench_parse.py
+'''
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import nutrients
+import units
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'food_details.html')
+PAGES = 20000
+
+def fixture_page():
+    '''
+    Return the food, the header and the rows of the saved food-details page.
+    '''
+    with open(FIXTURE, encoding='utf-8') as file:
+        return nutrients.parse_table_html(file.read())
+
+def fixture_sections():
+    '''
+    Return the nutrient sections of the saved food-details page.
+    '''
+    food, header_list, rows = fixture_page()
+    table_rows, sections = nutrients.parse_rows(rows)
+    return sections
+
+def synthetic_amounts(foods, first=0):
+    '''
+    Return the amounts of foods copies of the fixture page, named
+    'food {first}', 'food {first + 1}'...
+    '''
+    sections = fixture_sections()
+    return [amount for i in range(first, first + foods) for amount in units.page_amounts(sections, f'food {i}')]
+
+def synthetic_batch(foods, first=0, seed=None):
+    '''
+    Return the normalized long rows of synthetic_amounts(foods, first), every
+    value scaled at random between 0.5 and 1.5 when a seed is given.
+    '''
+    normalized = units.normalize(units.amounts_to_long(synthetic_amounts(foods, first)))
+    if seed is not None:
+        normalized['Value'] *= np.random.default_rng(seed).uniform(0.5, 1.5, len(normalized))
+    return normalized
+
+def write_batch(normalized, writer, csv_writer=None):
+    '''
+    Add the section tables of a normalized batch to writer (and csv_writer)
+    and close them.
+    '''
+    for table_name, df in units.to_sections(normalized).items():
+        writer.add(df, table_name)
+        if csv_writer is not None:
+            csv_writer.add(df)
+    writer.close()
+    if csv_writer is not None:
+        csv_writer.close()
+
+def main():
+    with open(FIXTURE, encoding='utf-8') as file:
+        html = file.read()
+
+    start = perf_counter()
+    for _ in range(PAGES // 100):
+        food, header_list, rows = nutrients.parse_table_html(html)
+    elapsed = perf_counter() - start
+    print(f'parse_table_html: {PAGES // 100 / elapsed:,.0f} pages/sec')
+
+    start = perf_counter()
+    for _ in range(PAGES):
+        table_rows, sections = nutrients.parse_rows(rows)
+    elapsed = perf_counter() - start
+
+    print(f'parse_rows: {PAGES / elapsed:,.0f} pages/sec ({elapsed / PAGES * 1e6:.1f} µs per page), '
+          f'{len(rows)} rows and {len(sections)} sections per page')
+
+if __name__ == '__main__':
+    main()
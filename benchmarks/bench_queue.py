@@ -0,0 +1,98 @@
+'''
+Time the shared job queue with several worker processes leasing from the
+same file, and check its guarantees: every job is leased exactly once while
+the workers finish their jobs, the jobs of a worker that stops are leased
+again once their lease expires, and a job failing max_attempts times ends
+up failed instead of pending forever.
+
+    python3 benchmarks/bench_queue.py [--jobs 2000] [--workers 4]
+
+Exits with an error when one of the checks fails.
+'''
+import os
+import sys
+import argparse
+import tempfile
+import multiprocessing
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from job_queue import JobQueue
+
+BATCH = 10
+
+def work(path, worker, leased):
+    '''
+    Lease BATCH jobs at a time and mark them done until none is left,
+    recording every job leased.
+    '''
+    jobs = JobQueue(path)
+    while True:
+        rows = jobs.lease(worker, BATCH)
+        if not rows:
+            break
+        for kind, key in rows:
+            leased.append(key)
+            jobs.done(kind, key)
+    jobs.close()
+
+def check_leases(path, count, workers):
+    '''
+    Every job leased exactly once by the concurrent workers, and all done.
+    '''
+    jobs = JobQueue(path)
+    jobs.add('url', [f'url {i}' for i in range(count)])
+    with multiprocessing.Manager() as manager:
+        leased = manager.list()
+        processes = [multiprocessing.Process(target=work, args=(path, f'worker {i}', leased)) for i in range(workers)]
+        start = perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = perf_counter() - start
+        leased = list(leased)
+
+    duplicates = len(leased) - len(set(leased))
+    counts = jobs.counts()
+    jobs.close()
+    print(f'{"workers":<10}{"jobs":>8}{"seconds":>10}{"jobs/sec":>10}{"duplicates":>12}')
+    print(f'{workers:<10}{len(leased):>8}{elapsed:>10.2f}{len(leased) / elapsed:>10.0f}{duplicates:>12}')
+    if duplicates or len(set(leased)) != count or counts != {('url', 'done'): count}:
+        sys.exit(f'Lease check failed: {len(set(leased))} of {count} jobs leased, {duplicates} twice, {counts}')
+
+def check_requeue(path):
+    '''
+    The jobs of a stopped worker come back once their lease expires, and
+    go to failed after max_attempts.
+    '''
+    jobs = JobQueue(path, lease_seconds=0.2, max_attempts=2)
+    jobs.add('url', ['a', 'b'])
+    first = jobs.lease('crashed', 2)
+    if jobs.lease('other', 2):
+        sys.exit('Requeue check failed: jobs leased twice before their lease expired')
+    sleep(0.3)
+    second = jobs.lease('other', 2)
+    if sorted(second) != sorted(first):
+        sys.exit(f'Requeue check failed: {second} leased again instead of {first}')
+    jobs.done('url', 'a')
+    sleep(0.3)
+    third = jobs.lease('last', 2)
+    counts = jobs.counts()
+    jobs.close()
+    if third or counts != {('url', 'done'): 1, ('url', 'failed'): 1}:
+        sys.exit(f'Requeue check failed: {third} leased a third time, {counts}')
+    print('Expired leases queued again, then failed after max_attempts')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder_name:
+        check_leases(os.path.join(folder_name, 'jobs.db'), arguments.jobs, arguments.workers)
+        check_requeue(os.path.join(folder_name, 'requeue.db'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+Compare the CPU time per page and the peak memory of the two ways of
+turning parsed pages into section DataFrames:
+- per page: a long DataFrame, normalize and to_sections for every page
+  (the extraction path before the Amount records)
+- records: units.page_amounts for every page and the DataFrames built once
+  per batch of pages, as the ResultWriter does
+
+    python3 benchmarks/bench_records.py
+'''
+import os
+import sys
+import tracemalloc
+from time import process_time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import units
+from bench_parse import fixture_sections
+
+PAGES = 1000
+PAGES_PER_BATCH = 20
+
+def per_page(pages):
+    for food, sections in pages:
+        units.to_sections(units.normalize(units.amounts_to_long(units.page_amounts(sections, food))))
+
+def records(pages):
+    batch = []
+    for i, (food, sections) in enumerate(pages, 1):
+        batch += units.page_amounts(sections, food)
+        if i % PAGES_PER_BATCH == 0:
+            units.to_sections(units.normalize(units.amounts_to_long(batch)))
+            batch = []
+    if batch:
+        units.to_sections(units.normalize(units.amounts_to_long(batch)))
+
+def measure(function, pages):
+    '''
+    Return the CPU time per page in ms and the peak of the traced memory in KB.
+    '''
+    start = process_time()
+    function(pages)
+    cpu = (process_time() - start) / len(pages) * 1000
+
+    tracemalloc.start()
+    function(pages[:PAGES_PER_BATCH * 5])
+    peak = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return cpu, peak
+
+def main():
+    sections = fixture_sections()
+    pages = [(f'food {i}', sections) for i in range(PAGES)]
+
+    # Warm up the imports and the caches of pandas
+    per_page(pages[:5])
+    records(pages[:5])
+
+    amount = units.page_amounts(sections, 'food')[0]
+    as_dict = {slot: getattr(amount, slot) for slot in units.Amount.__slots__}
+    print(f'Amount record: {sys.getsizeof(amount)} bytes (as a dict: {sys.getsizeof(as_dict)} bytes)')
+    print(f'{"path":<12}{"CPU ms/page":>14}{"peak KB":>10}')
+    for name, function in (('per page', per_page), ('records', records)):
+        cpu, peak = measure(function, pages)
+        print(f'{name:<12}{cpu:>14.3f}{peak:>10.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+'''
+Compare the bulk and the per-row table scraping on a saved food-details page.
+
+    python3 benchmarks/bench_scrape.py
+
+Prints the number of WebDriver round trips and the time taken by each path.
+'''
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tables_reader
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'food_details.html')
+REPEATS = 5
+
+def count_round_trips(driver):
+    '''
+    Wrap driver.execute, through which every WebDriver command passes,
+    and return a dictionary holding the number of calls.
+    '''
+    counter = {'calls': 0}
+    execute = driver.execute
+
+    def counting_execute(*args, **kwargs):
+        counter['calls'] += 1
+        return execute(*args, **kwargs)
+
+    driver.execute = counting_execute
+    return counter
+
+def measure(driver, counter, scrape):
+    counter['calls'] = 0
+    start = perf_counter()
+    for _ in range(REPEATS):
+        food, header_list, rows = scrape(driver)
+    elapsed = (perf_counter() - start) / REPEATS
+    return counter['calls'] // REPEATS, elapsed, len(rows)
+
+def main():
+    # Offline: a local driver only, and no driver cache file left behind
+    service, options = tables_reader.set_up_driver(cache_path='', offline=True)
+    if service == '' and options == '':
+        sys.exit('No WebDriver available')
+
+    driver = tables_reader.initialize_driver(service, options)
+    try:
+        driver.get('file://' + FIXTURE)
+        counter = count_round_trips(driver)
+
+        for name, scrape in [('per-row', tables_reader.scrape_table_by_rows), ('bulk', tables_reader.scrape_table)]:
+            calls, elapsed, rows = measure(driver, counter, scrape)
+            print(f'{name:>8}: {rows} rows, {calls} round trips, {elapsed * 1000:.1f} ms per page')
+    finally:
+        driver.quit()
+
+if __name__ == '__main__':
+    main()
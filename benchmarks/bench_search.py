@@ -0,0 +1,41 @@
+'''
+Time the local search index on the descriptions of
+example_corrected_foods.txt, repeated with a suffix to reach 5000
+descriptions, with exact, reordered, misspelled and generic food names.
+
+    python3 benchmarks/bench_search.py
+'''
+import os
+import sys
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from search_index import SearchIndex
+
+DESCRIPTIONS = 5000
+QUERIES = ['Broccoli, raw', 'raw broccoli', 'Brocoli raw', 'olive oil extra virgin', 'apple', 'cashews']
+REPEAT = 2000
+
+def main():
+    with open(os.path.join(ROOT, 'example_corrected_foods.txt')) as file:
+        descriptions = [line.strip() for line in file if line.strip()]
+
+    index = SearchIndex()
+    start = perf_counter()
+    for i in range(DESCRIPTIONS):
+        description = descriptions[i % len(descriptions)]
+        index.add(description if i < len(descriptions) else f'{description}, variety {i}', f'url {i}')
+    print(f'{len(index)} descriptions indexed in {(perf_counter() - start) * 1000:.0f} ms\n')
+
+    print(f'{"query":<26}{"us/query":>10}  best match')
+    for query in QUERIES:
+        start = perf_counter()
+        for _ in range(REPEAT):
+            candidates = index.search(query)
+        elapsed = (perf_counter() - start) / REPEAT * 1e6
+        score, description, url = candidates[0]
+        print(f'{query:<26}{elapsed:>10.1f}  {description} ({score:.2f})')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+'''
+End-to-end benchmark against a local stand-in of the FDC site, fully offline.
+
+    python3 benchmarks/bench_site.py                  # run and compare with the baseline
+    python3 benchmarks/bench_site.py --save-baseline  # run and store the results as the baseline
+
+A local HTTP server serves benchmarks/site/fdc-app.html filled with synthetic
+foods derived from the saved fixture page. search_food, extract_table_data,
+save_to_db and save_to_csv are driven against it with a headless browser and
+the script reports pages/sec, per-stage latency percentiles, DB rows/sec
+and the resident memory of the browser. With --lean the browser uses the
+lean profile (compare it with a baseline saved with --name lean). With
+--no-browser the synthetic pages go straight to the parser and only the
+parsing and the writers are timed (compare it with --name no-browser).
+A baseline keeps the machine and the browser it was measured with.
+'''
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import threading
+from functools import partial
+from time import perf_counter
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+import drivers
+import tables_reader
+import units
+from writers import SQLiteWriter, NormalizedWriter
+from bench_parse import fixture_page
+
+SITE = os.path.join(BENCHMARKS, 'site')
+BASELINES = os.path.join(BENCHMARKS, 'baselines.json')
+FOODS_PER_GROUP = 3
+# Slower than the baseline by more than this fraction counts as a regression
+TOLERANCE = 0.2
+
+def synthetic_foods(count, seed=0):
+    '''
+    Build {fdc id: [description, rows]} from the fixture page, scaling the amounts.
+    Every group of FOODS_PER_GROUP foods shares a search keyword gNNNN.
+    '''
+    food, header_list, rows = fixture_page()
+    generator = random.Random(seed)
+    foods = {}
+    for i in range(count):
+        scale = generator.uniform(0.5, 1.5)
+        food_rows = []
+        for name, amount, unit in rows:
+            if amount and amount.lstrip('<').replace('.', '', 1).isdigit():
+                prefix = '<' if amount.startswith('<') else ''
+                amount = prefix + f'{float(amount.lstrip("<")) * scale:.3f}'.rstrip('0').rstrip('.')
+            food_rows.append([name, amount, unit])
+        foods[str(100000 + i)] = [f'Sample food {i}, g{i // FOODS_PER_GROUP:04d}', food_rows]
+    return foods
+
+class SiteHandler(SimpleHTTPRequestHandler):
+    '''
+    Serve the stand-in application with the synthetic foods embedded.
+    '''
+    def __init__(self, *args, page=b'', **kwargs):
+        self.page = page
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/fdc-app.html':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(self.page)))
+        self.end_headers()
+        self.wfile.write(self.page)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_site(foods):
+    '''
+    Start the local site in a background thread and return the server.
+    '''
+    with open(os.path.join(SITE, 'fdc-app.html'), encoding='utf-8') as file:
+        page = file.read().replace('/*FOODS*/', json.dumps(foods)).encode('utf-8')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(SiteHandler, page=page))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def percentiles(samples):
+    '''
+    Return the p50, p90 and p99 of a list of durations, in milliseconds.
+    '''
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {'p50_ms': pick(0.5), 'p90_ms': pick(0.9), 'p99_ms': pick(0.99)}
+
+def timed(samples, function, *args):
+    start = perf_counter()
+    result = function(*args)
+    samples.append(perf_counter() - start)
+    return result
+
+def browse(foods, folder_name, lean, save):
+    '''
+    Search and extract every synthetic food with a headless browser against
+    the local site, handing the amounts of every page to save.
+    Return the durations of the stages, the URLs, the browser memory after
+    every page and the name and version of the browser.
+    '''
+    server = start_site(foods)
+    tables_reader.FDC_APP_URL = f'http://127.0.0.1:{server.server_port}/fdc-app.html'
+
+    # Offline: a local driver only, and no driver cache file left behind
+    service, options = tables_reader.set_up_driver(cache_path='', offline=True, lean=lean)
+    if service == '' and options == '':
+        server.shutdown()
+        sys.exit('No WebDriver available (run with --no-browser to only time the parsing and the writers)')
+    driver = tables_reader.initialize_driver(service, options)
+    browser = f'{driver.capabilities.get("browserName")} {driver.capabilities.get("browserVersion")}'
+
+    stages = {'search': [], 'extract': []}
+    rss = []
+    try:
+        queries = sorted({description.split(', ')[-1] for description, rows in foods.values()})
+        for query in queries:
+            timed(stages['search'], tables_reader.search_food, driver, query, folder_name)
+
+        # The "No results found" page must end the search at once, with no results
+        start = perf_counter()
+        missing = tables_reader.search_food(driver, 'nosuchfood', folder_name, max_attempts=1, timeout=5)
+        if missing != [] or perf_counter() - start > 5:
+            sys.exit(f'No-results check failed: {missing} after {perf_counter() - start:.1f} s')
+
+        with open(folder_name + '/urls_' + folder_name.split('/')[-1] + '.txt') as file:
+            urls = [line.strip() for line in file if line.strip()]
+        for url in urls:
+            timed(stages['extract'], tables_reader.extract_table_data, driver, url, folder_name, save)
+            rss.append(drivers.browser_rss(driver) or 0.0)
+    finally:
+        driver.quit()
+        server.shutdown()
+    return stages, urls, rss, browser
+
+def run_benchmark(foods_count, folder_name, lean=False, browser=True):
+    '''
+    Run the benchmark and return its results and the browser used, None
+    without a browser: the synthetic pages then go straight to the parser.
+    '''
+    foods = synthetic_foods(foods_count)
+    pages = []
+    if browser:
+        stages, urls, rss, browser = browse(foods, folder_name, lean, pages.append)
+    else:
+        stages, urls, rss, browser = {'parse': []}, list(foods), [], None
+        for description, rows in foods.values():
+            timed(stages['parse'], tables_reader.process_table, description, ['Name', 'Amount', 'Unit'], rows, pages.append)
+
+    # The sections of every page, as save_amounts would write them one page at
+    # a time, built apart so that the stages above only time the browser and the parser
+    stages.update({'to_dataframes': [], 'save_to_db': [], 'save_to_csv': []})
+    sections = []
+    for amounts in pages:
+        frames = timed(stages['to_dataframes'], lambda: units.to_sections(units.normalize(units.amounts_to_long(amounts))))
+        sections += [(df, table_name) for table_name, df in frames.items()]
+
+    db_path = 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db'
+    csv_path = folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv'
+    for df, table_name in sections:
+        timed(stages['save_to_db'], tables_reader.save_to_db, df, table_name, db_path)
+        timed(stages['save_to_csv'], tables_reader.save_to_csv, df, csv_path)
+
+    # The same rows through the long-lived batched writer used by main()
+    start = perf_counter()
+    writer = SQLiteWriter('sqlite:///' + folder_name + '/batched.db')
+    for df, table_name in sections:
+        writer.add(df, table_name)
+    writer.close()
+    batched_elapsed = perf_counter() - start
+
+    # And through the writer of the normalized layout
+    start = perf_counter()
+    writer = NormalizedWriter('sqlite:///' + folder_name + '/normalized.db')
+    for df, table_name in sections:
+        writer.add(df, table_name)
+    writer.close()
+    normalized_elapsed = perf_counter() - start
+
+    results = {
+        'foods': foods_count,
+        'urls': len(urls),
+        'db_rows_per_sec': len(sections) / sum(stages['save_to_db']),
+        'db_batched_rows_per_sec': len(sections) / batched_elapsed,
+        'db_normalized_rows_per_sec': len(sections) / normalized_elapsed,
+        'csv_rows_per_sec': len(sections) / sum(stages['save_to_csv']),
+    }
+    if browser is not None:
+        results.update({
+            'search_pages_per_sec': len(stages['search']) / sum(stages['search']),
+            'extract_pages_per_sec': len(stages['extract']) / sum(stages['extract']),
+            'browser_rss_mb_max': max(rss),
+            'browser_rss_mb_mean': sum(rss) / len(rss),
+        })
+    for stage, samples in stages.items():
+        for name, value in percentiles(samples).items():
+            results[f'{stage}_{name}'] = value
+    return results, browser
+
+def machine(browser):
+    '''
+    Describe where the results were measured, saved next to a baseline.
+    '''
+    import platform
+    processor = platform.processor() or platform.machine()
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo') as file:
+            names = [line.split(':', 1)[1].strip() for line in file if line.startswith('model name')]
+        processor = names[0] if names else processor
+    return {
+        'platform': platform.platform(),
+        'processor': processor,
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'browser': browser,
+    }
+
+def compare(results, baseline):
+    '''
+    Print every metric next to its baseline and return the regressions.
+    '''
+    regressions = []
+    for name, value in results.items():
+        if name in ('foods', 'urls') or name not in baseline:
+            print(f'{name:>28}: {value:12.2f}')
+            continue
+        reference = baseline[name]
+        higher_is_better = name.endswith('_per_sec')
+        change = (value - reference) / reference if reference else 0.0
+        worse = -change if higher_is_better else change
+        flag = '  REGRESSION' if worse > TOLERANCE else ''
+        print(f'{name:>28}: {value:12.2f}  (baseline {reference:.2f}, {change:+.0%}){flag}')
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--foods', type=int, default=60, help='number of synthetic foods served by the site')
+    parser.add_argument('--name', default='default', help='name of the baseline to compare with or save')
+    parser.add_argument('--lean', action='store_true', help='use the lean browser profile')
+    parser.add_argument('--no-browser', action='store_true', help='skip the browser stages, only time the parsing and the writers')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder_name:
+        results, browser = run_benchmark(args.foods, folder_name, args.lean, not args.no_browser)
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as file:
+            baselines = json.load(file)
+
+    regressions = compare(results, baselines.get(args.name, {}))
+    if args.save_baseline:
+        baselines[args.name] = dict(results, machine=machine(browser))
+        with open(BASELINES, 'w') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f'Baseline "{args.name}" saved in {BASELINES}')
+    elif regressions:
+        sys.exit(f'Regressions against baseline "{args.name}": {", ".join(regressions)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+'''
+Measure the unit normalization on a batch of nutrient rows built by
+repeating the rows of the saved food-details page.
+
+    python3 benchmarks/bench_units.py
+'''
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import units
+from bench_parse import synthetic_amounts
+
+FOODS = 1000
+
+def main():
+    batch = units.amounts_to_long(synthetic_amounts(FOODS))
+
+    start = perf_counter()
+    normalized = units.normalize(batch)
+    elapsed = perf_counter() - start
+    print(f'normalize: {len(batch):,} rows in {elapsed * 1000:.1f} ms')
+
+    start = perf_counter()
+    frames = units.to_sections(normalized)
+    elapsed = perf_counter() - start
+    print(f'to_sections: {len(frames)} section tables of {FOODS} foods in {elapsed * 1000:.1f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+'''
+Regression checks of the nutrients spelled with another case on different
+pages ('Sugars, Total' and 'Sugars, total'): SQLite does not tell such
+column names apart, so they must end up in one column with every value,
+in the wide tables and in the section views of the normalized layout.
+
+    python3 benchmarks/check_case.py
+
+Exits with an error when a check fails.
+'''
+import os
+import sys
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import merge
+import units
+from writers import ResultWriter
+from bench_parse import fixture_sections
+
+SECTION = 'carbohydrates'
+NUTRIENT = 'Sugars, Total'
+# 4.17 g of the fixture page, in mg
+EXPECTED = 4170.0
+
+def fixture_amounts(food, nutrient=NUTRIENT):
+    '''
+    The amounts of the fixture page for a food, with the sugars spelled nutrient.
+    '''
+    amounts = units.page_amounts(fixture_sections(), food)
+    for amount in amounts:
+        if amount.nutrient == NUTRIENT:
+            amount.nutrient = nutrient
+    return amounts
+
+def check(name, values):
+    '''
+    values is {food: sugars read back}: every one must be EXPECTED.
+    '''
+    wrong = {food: value for food, value in values.items() if value != EXPECTED}
+    if wrong:
+        sys.exit(f'{name}: sugars lost or wrong for {wrong}')
+    print(f'{name}: {len(values)} foods, both spellings in one column')
+
+def write_run(folder_name, name, pages, layout='wide'):
+    '''
+    Write the (food, nutrient spelling) pages with a ResultWriter and return the database.
+    '''
+    run_folder = os.path.join(folder_name, name)
+    os.makedirs(run_folder)
+    writer = ResultWriter(run_folder, layout=layout)
+    for food, nutrient in pages:
+        writer.save(fixture_amounts(food, nutrient))
+    writer.close()
+    return os.path.join(run_folder, f'food_components_{name}.db')
+
+def read_sugars(db_file):
+    connection = sqlite3.connect(db_file)
+    try:
+        return dict(connection.execute(f'SELECT "Food", "{NUTRIENT}" FROM "{SECTION}"'))
+    finally:
+        connection.close()
+
+def check_writer(folder_name, layout):
+    '''
+    Both spellings in one batch of the ResultWriter, as one pivoted section.
+    '''
+    db_file = write_run(folder_name, f'writer_{layout}', [('almonds', NUTRIENT), ('other', NUTRIENT.lower())], layout)
+    check(f'ResultWriter ({layout})', read_sugars(db_file))
+
+def check_merge(folder_name, layout):
+    '''
+    A run with the other spelling merged after the master got the first one.
+    '''
+    db_files = [
+        write_run(folder_name, f'20240101_000000_{layout}', [('almonds', NUTRIENT)], layout),
+        write_run(folder_name, f'20240101_000001_{layout}', [('other', NUTRIENT.lower())], layout),
+        ]
+    output = os.path.join(folder_name, f'master_{layout}.db')
+    merged = merge.merge(db_files, output, layout)
+    if merged != len(db_files):
+        sys.exit(f'merge ({layout}): {merged} of {len(db_files)} runs merged')
+    check(f'merge ({layout})', read_sugars(output))
+
+def main():
+    with tempfile.TemporaryDirectory() as folder_name:
+        for layout in ('wide', 'normalized'):
+            check_writer(folder_name, layout)
+            check_merge(folder_name, layout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+'''
+Nutrients eaten with a list of foods and their amounts in grams, from a
+food_components database (either layout, a run or a merged master).
+
+    python3 diet.py diet.txt                       # newest database of results/
+    python3 diet.py diet.txt --db master.db --top 3
+
+Every line of the diet file is an amount in grams and a food, for example
+"150 g Broccoli, raw" or "30 almonds"; without an amount it counts 100 g.
+The names are matched with the food descriptions of the database, exactly
+or with the local search index.
+'''
+import os
+import re
+import glob
+import logging
+import argparse
+import numpy as np
+import export
+from search_index import SearchIndex
+
+# Lowest score of the search index for a diet name to be matched with a food description
+MATCH_SCORE = 0.6
+DIET_LINE = re.compile(r'^(\d+(?:[.,]\d+)?)\s*(?:g|grams?)?\s+(.+)$', re.IGNORECASE)
+
+_diets = {}
+
+class Diet:
+    '''
+    The food x nutrient matrix of a database, loaded once, ready to add up
+    the nutrients of lists of foods. per_gram[i, j] is the amount of
+    nutrient j in one gram of food i, 0 when the food does not report it;
+    reported[i, j] tells whether it does.
+    '''
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.foods = matrix.foods
+        self.columns = matrix.columns
+        self.names = matrix.column_names()
+        self.reported = ~np.isnan(matrix.values)
+        self.per_gram = np.where(self.reported, matrix.values, 0).astype(np.float32) / 100
+        self._rows = {food: i for i, food in enumerate(self.foods)}
+        self._search_index = None
+
+    @classmethod
+    def load(cls, db_file):
+        '''
+        Return the Diet of a database, cached in memory until the database
+        changes and, when pyarrow is installed, in an Arrow file next to it
+        (see cache_path) so that the next processes skip the SQL queries.
+        '''
+        key = (os.path.abspath(db_file), _version(db_file))
+        if key not in _diets:
+            _diets.clear()
+            _diets[key] = cls(_load_matrix(db_file))
+        return _diets[key]
+
+    def resolve(self, names):
+        '''
+        Return {name: food description} for the names found in the database,
+        exactly or with the best match of the search index scoring at least
+        MATCH_SCORE. The names not found are left out.
+        '''
+        resolved = {}
+        for name in names:
+            if name in self._rows:
+                resolved[name] = name
+                continue
+            if self._search_index is None:
+                self._search_index = SearchIndex()
+                for food in self.foods:
+                    self._search_index.add(food)
+            candidates = self._search_index.search(name, limit=1)
+            if candidates and candidates[0][0] >= MATCH_SCORE:
+                resolved[name] = candidates[0][1]
+                logging.info(f'"{name}" matched with "{candidates[0][1]}" (score {candidates[0][0]:.2f})')
+            else:
+                logging.warning(f'"{name}" not found in the database')
+        return resolved
+
+    def grams(self, plans):
+        '''
+        Turn meal plans, dicts {food description: grams}, into a plans x foods
+        matrix of grams. A food eaten twice in a plan is added up.
+        '''
+        grams = np.zeros((len(plans), len(self.foods)), dtype=np.float32)
+        for i, plan in enumerate(plans):
+            for food, amount in plan.items():
+                grams[i, self._rows[food]] += amount
+        return grams
+
+    def totals(self, grams):
+        '''
+        Nutrients of a batch of meal plans: a plans x nutrients matrix, from a
+        plans x foods matrix of grams (see grams), in a single matrix product.
+        '''
+        return grams @ self.per_gram
+
+    def score(self, grams, targets):
+        '''
+        Score a batch of meal plans against daily targets {column name: amount},
+        in the unit of the column: the mean share of every target reached,
+        capped at 1 for each one. Return one score per plan.
+        '''
+        columns = [self.names.index(name) for name in targets]
+        goals = np.array(list(targets.values()), dtype=np.float32)
+        return np.minimum(grams @ self.per_gram[:, columns] / goals, 1).mean(axis=1)
+
+    def report(self, plan, top=3):
+        '''
+        Return a DataFrame with the total of every nutrient of a meal plan
+        ({food description: grams}), its section and unit, the number of
+        foods of the plan reporting it and the foods contributing the most.
+        '''
+        import pandas as pd
+        foods = list(plan)
+        rows = [self._rows[food] for food in foods]
+        amounts = np.array([plan[food] for food in foods], dtype=np.float64)
+        contributions = amounts[:, None] * self.per_gram[rows]
+        totals = contributions.sum(axis=0)
+        order = np.argsort(-contributions, axis=0, kind='stable')[:top]
+
+        contributors = []
+        for j, total in enumerate(totals):
+            shares = [
+                f'{foods[i]} {contributions[i, j] / total:.0%}'
+                for i in order[:, j] if total > 0 and contributions[i, j] > 0
+                ]
+            contributors.append(', '.join(shares))
+        return pd.DataFrame({
+            'Section': [section for section, nutrient, unit in self.columns],
+            'Nutrient': self.names,
+            'Total': totals,
+            'Unit': [unit or '' for section, nutrient, unit in self.columns],
+            'Reported by': self.reported[rows].sum(axis=0),
+            'Top contributors': contributors,
+            })
+
+def _version(db_file):
+    '''
+    Size and modification time of a database and of its WAL file.
+    '''
+    version = []
+    for path in (db_file, db_file + '-wal'):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            version += [stat.st_size, stat.st_mtime_ns]
+    return tuple(version)
+
+def cache_path(db_file):
+    return os.path.splitext(db_file)[0] + '_matrix.arrow'
+
+def _load_matrix(db_file):
+    '''
+    Read the NutrientMatrix of a database from its Arrow cache if it is
+    newer than the database, else from the database, saving the cache.
+    '''
+    arrow_file = cache_path(db_file)
+    newest = max(os.path.getmtime(path) for path in (db_file, db_file + '-wal') if os.path.exists(path))
+    try:
+        if os.path.exists(arrow_file) and os.path.getmtime(arrow_file) >= newest:
+            return export.NutrientMatrix.from_arrow(export.read_matrix(arrow_file))
+        matrix = export.NutrientMatrix.from_db(db_file)
+        export.write_matrix(matrix, arrow_file)
+        return matrix
+    except ImportError:
+        # pyarrow is optional: without it the matrix is only cached in memory
+        return export.NutrientMatrix.from_db(db_file)
+
+def read_diet(file_path):
+    '''
+    Read a diet file and return [(food name, grams)].
+    '''
+    diet = []
+    with open(file_path) as file:
+        for line in file:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            match = DIET_LINE.match(line)
+            if match:
+                diet.append((match.group(2), float(match.group(1).replace(',', '.'))))
+            else:
+                diet.append((line, 100.0))
+    return diet
+
+def newest_db(results_directory='./results/'):
+    '''
+    Return the newest food_components database of the results folder, or None.
+    '''
+    db_files = glob.glob(os.path.join(results_directory, '*', 'food_components_*.db'))
+    db_files += glob.glob(os.path.join(results_directory, 'food_components_*.db'))
+    return max(db_files, key=os.path.getmtime, default=None)
+
+def main():
+    parser = argparse.ArgumentParser(description='Add up the nutrients of a list of foods with their amounts in grams.')
+    parser.add_argument('diet_file', help='one food per line, with its amount in grams first ("150 g Broccoli, raw")')
+    parser.add_argument('--db', help='food_components database (default: the newest one of results/)')
+    parser.add_argument('--top', type=int, default=3, help='foods contributing the most to every nutrient')
+    parser.add_argument('--section', help='only show this section')
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    db_file = arguments.db or newest_db()
+    if db_file is None or not os.path.exists(db_file):
+        parser.error('no food_components database found, run main.py first or pass --db')
+
+    diet = Diet.load(db_file)
+    eaten = read_diet(arguments.diet_file)
+    resolved = diet.resolve([name for name, grams in eaten])
+    plan = {}
+    for name, grams in eaten:
+        if name in resolved:
+            plan[resolved[name]] = plan.get(resolved[name], 0) + grams
+    if not plan:
+        parser.error('none of the foods of the diet is in the database')
+
+    report = diet.report(plan, arguments.top)
+    print(f'{len(plan)} foods, {sum(plan.values()):.0f} g, from {db_file}\n')
+    for section, rows in report.groupby('Section', sort=False):
+        if arguments.section and section != arguments.section:
+            continue
+        print(f'{section}')
+        print(rows.drop(columns='Section').to_string(index=False, float_format=lambda value: f'{value:.2f}'))
+        print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import logging
+import queue
+import threading
+import metrics
+import tables_reader
+
+class DriverPool:
+    '''
+    Keep a set of warm WebDriver sessions alive and hand them out on demand,
+    so that every page does not pay a full browser cold start.
+    A session is recycled after `max_pages` pages or when its health check fails.
+    If no browser started yet and one fails to start, `fallback(options, error)`
+    is asked for the (service, options) of another browser, or None.
+    '''
+    def __init__(self, service, options, size=1, max_pages=50, fallback=None):
+        self.service = service
+        self.options = options
+        self.fallback = fallback
+        self.size = size
+        self.max_pages = max_pages
+        self.hits = 0
+        self.launches = 0
+        self.launch_failures = 0
+        self.recycles = 0
+        self._idle = queue.Queue()
+        self._pages = {}
+        self._created = 0
+        self._lock = threading.Lock()
+        self._fallback_lock = threading.Lock()
+
+    def _launch(self):
+        '''
+        Start a new browser session and register it in the pool, moving to
+        the browser of the fallback while none has started.
+        '''
+        while True:
+            service, options = self.service, self.options
+            try:
+                with metrics.timer('driver_start'):
+                    driver = tables_reader.initialize_driver(service, options)
+                break
+            except Exception as e:
+                with self._fallback_lock:
+                    # Another worker may have moved to the next browser already: try it
+                    if self.options is not options:
+                        continue
+                    if self.launches > 0 or self.fallback is None:
+                        raise
+                    replacement = self.fallback(options, e)
+                    if replacement is None:
+                        # No other browser: stop asking
+                        self.fallback = None
+                        raise
+                    self.service, self.options = replacement
+        with self._lock:
+            self.launches += 1
+            self._pages[id(driver)] = 0
+        logging.info(f'Driver pool: launched a new browser ({self.launches} launches so far)')
+        return driver
+
+    def _discard(self, driver):
+        '''
+        Quit a browser session and forget about it.
+        '''
+        with self._lock:
+            self._pages.pop(id(driver), None)
+            self._created -= 1
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.error(f'Driver pool: error while quitting a driver: {e}')
+
+    @staticmethod
+    def is_healthy(driver):
+        '''
+        Cheap liveness probe: a dead session raises on any command.
+        '''
+        try:
+            driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        '''
+        Return a warm driver if one is idle, otherwise launch a new one.
+        Blocks when the pool is already at its maximum size.
+        '''
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_launch = self._created < self.size
+                    if can_launch:
+                        self._created += 1
+                if can_launch:
+                    try:
+                        return self._launch()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                            self.launch_failures += 1
+                        raise
+                driver = self._idle.get()
+
+            if self.is_healthy(driver):
+                with self._lock:
+                    self.hits += 1
+                return driver
+
+            logging.warning('Driver pool: idle driver failed the health check, replacing it')
+            with self._lock:
+                self.recycles += 1
+            self._discard(driver)
+
+    def release(self, driver, broken=False):
+        '''
+        Give a driver back to the pool, recycling it if it is broken
+        or has served `max_pages` pages.
+        '''
+        with self._lock:
+            pages = self._pages.get(id(driver), 0) + 1
+            self._pages[id(driver)] = pages
+
+        if broken or pages >= self.max_pages:
+            reason = 'broken' if broken else f'served {pages} pages'
+            logging.info(f'Driver pool: recycling driver ({reason})')
+            with self._lock:
+                self.recycles += 1
+            self._discard(driver)
+        else:
+            self._idle.put(driver)
+
+    def driver(self):
+        '''
+        Context manager that acquires a driver and releases it afterwards,
+        recycling it if the body raised and left the session dead.
+        '''
+        return _PooledDriver(self)
+
+    def stats(self):
+        '''
+        Return the pool counters as a dictionary.
+        '''
+        return {'hits': self.hits, 'launches': self.launches, 'recycles': self.recycles}
+
+    def close(self):
+        '''
+        Quit every idle driver and log the pool statistics.
+        '''
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+        logging.info(f'Driver pool closed: {self.hits} hits, {self.launches} launches, {self.recycles} recycles')
+
+class _PooledDriver:
+    def __init__(self, pool):
+        self.pool = pool
+        self.driver = None
+
+    def __enter__(self):
+        self.driver = self.pool.acquire()
+        return self.driver
+
+    def __exit__(self, exc_type, exc, tb):
+        # Only throw the browser away if the error left it unusable
+        broken = exc_type is not None and not self.pool.is_healthy(self.driver)
+        self.pool.release(self.driver, broken=broken)
+        return False
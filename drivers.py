@@ -0,0 +1,337 @@
+import os
+import json
+import shutil
+import logging
+import subprocess
+from time import time
+
+# Driver executable and browser binaries of every supported browser, in order of preference
+BROWSERS = {
+    'firefox': ('geckodriver', ('firefox', 'firefox-esr')),
+    'chrome': ('chromedriver', ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome')),
+    'edge': ('msedgedriver', ('microsoft-edge', 'microsoft-edge-stable', 'msedge')),
+}
+
+# Usual install locations of the browsers that are not on the PATH (macOS, Windows)
+BROWSER_LOCATIONS = {
+    'firefox': (
+        '/Applications/Firefox.app/Contents/MacOS/firefox',
+        r'C:\Program Files\Mozilla Firefox\firefox.exe',
+        r'C:\Program Files (x86)\Mozilla Firefox\firefox.exe',
+    ),
+    'chrome': (
+        '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
+        r'C:\Program Files\Google\Chrome\Application\chrome.exe',
+        r'C:\Program Files (x86)\Google\Chrome\Application\chrome.exe',
+    ),
+    'edge': (
+        '/Applications/Microsoft Edge.app/Contents/MacOS/Microsoft Edge',
+        r'C:\Program Files\Microsoft\Edge\Application\msedge.exe',
+        r'C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe',
+    ),
+}
+
+# Folder where a driver can be dropped by hand, next to the program
+LOCAL_DRIVERS = 'drivers'
+
+# Hosts of the analytics and web fonts loaded by the FDC pages, not needed to read the tables
+BLOCKED_HOSTS = (
+    'dap.digitalgov.gov',
+    'www.google-analytics.com',
+    'ssl.google-analytics.com',
+    'www.googletagmanager.com',
+    'stats.g.doubleclick.net',
+    'fonts.googleapis.com',
+    'fonts.gstatic.com',
+)
+
+# Lean profile of Firefox: no images, web fonts, disk cache, telemetry or extension updates,
+# a single content process and the blocked hosts resolved to localhost. The memory
+# cache is only capped: the scripts of the FDC application are the same on every page
+LEAN_FIREFOX_PREFS = {
+    'permissions.default.image': 2,
+    'gfx.downloadable_fonts.enabled': False,
+    'media.autoplay.default': 5,
+    'browser.cache.disk.enable': False,
+    'browser.cache.memory.capacity': 32768,
+    'browser.sessionhistory.max_entries': 2,
+    'browser.sessionhistory.max_total_viewers': 0,
+    'dom.ipc.processCount': 1,
+    'extensions.update.enabled': False,
+    'app.update.auto': False,
+    'browser.safebrowsing.malware.enabled': False,
+    'browser.safebrowsing.phishing.enabled': False,
+    'toolkit.telemetry.enabled': False,
+    'datareporting.healthreport.uploadEnabled': False,
+    'network.prefetch-next': False,
+    'network.dns.localDomains': ','.join(BLOCKED_HOSTS),
+}
+
+# Lean profile of Chrome and Edge
+LEAN_CHROMIUM_ARGUMENTS = [
+    '--blink-settings=imagesEnabled=false',
+    '--disable-extensions',
+    '--disable-component-extensions-with-background-pages',
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-gpu',
+    '--mute-audio',
+    '--no-first-run',
+    '--disk-cache-size=33554432',
+    '--media-cache-size=1',
+    '--aggressive-cache-discard',
+    '--renderer-process-limit=1',
+    '--host-resolver-rules=' + ', '.join(f'MAP {host} ~NOTFOUND' for host in BLOCKED_HOSTS),
+]
+
+def browser_installed(browser):
+    '''
+    Return True if the browser is on the PATH or in one of its usual locations.
+    '''
+    return any(shutil.which(binary) for binary in BROWSERS[browser][1]) or any(os.path.exists(path) for path in BROWSER_LOCATIONS[browser])
+
+def probe(driver_path):
+    '''
+    Cheap availability check of a driver: run it with --version, without
+    starting any browser. Return its version line, or None if it does not run.
+    '''
+    try:
+        result = subprocess.run([driver_path, '--version'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError) as e:
+        logging.debug(f'Driver probe of {driver_path} failed: {e}')
+        return None
+    if result.returncode != 0:
+        return None
+    return (result.stdout.strip().splitlines() or [''])[0]
+
+def local_driver(browser):
+    '''
+    Return the path of a driver installed locally (drivers folder or PATH), or None.
+    '''
+    driver_name = BROWSERS[browser][0]
+    for name in (driver_name, driver_name + '.exe'):
+        path = os.path.join(LOCAL_DRIVERS, name)
+        if os.path.isfile(path):
+            return os.path.abspath(path)
+    return shutil.which(driver_name)
+
+def downloaded_driver(browser):
+    '''
+    Return the path of the driver installed by webdriver-manager (this needs the network).
+    '''
+    if browser == 'firefox':
+        from webdriver_manager.firefox import GeckoDriverManager
+        return GeckoDriverManager().install()
+    if browser == 'chrome':
+        from webdriver_manager.chrome import ChromeDriverManager
+        return ChromeDriverManager().install()
+    from webdriver_manager.microsoft import EdgeChromiumDriverManager
+    return EdgeChromiumDriverManager().install()
+
+def _fingerprint(path):
+    '''
+    Size and modification time of a file, to notice a replaced driver.
+    '''
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+def _read_cache(cache_path):
+    '''
+    Return the content of the cache file, {} if there is none or it cannot be read.
+    '''
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path) as file:
+            entry = json.load(file)
+        return entry if isinstance(entry, dict) else {}
+    except (OSError, ValueError) as e:
+        logging.warning(f'Driver cache {cache_path} ignored: {e}')
+        return {}
+
+def _write_cache(cache_path, entry):
+    temporary_path = cache_path + '.tmp'
+    with open(temporary_path, 'w') as file:
+        json.dump(entry, file, indent=2)
+    os.replace(temporary_path, cache_path)
+
+def failed_browsers(cache_path, max_age):
+    '''
+    Return the browsers that did not start in the last max_age seconds, see mark_failed.
+    '''
+    failed = _read_cache(cache_path).get('failed', {})
+    return {browser for browser, when in failed.items() if isinstance(when, (int, float)) and time() - when <= max_age}
+
+def mark_failed(cache_path, browser):
+    '''
+    Remember in the cache file that a browser found by resolve did not start,
+    so that the next runs try it after the other browsers.
+    '''
+    if not cache_path:
+        return
+    entry = _read_cache(cache_path)
+    entry.setdefault('failed', {})[browser] = time()
+    _write_cache(cache_path, entry)
+
+def load_cached(cache_path, max_age):
+    '''
+    Return the (browser, driver path) saved in the cache file if it is still
+    valid: not older than max_age seconds, pointing to the same driver file
+    and of a browser that did not fail to start since.
+    '''
+    entry = _read_cache(cache_path)
+    if 'browser' not in entry:
+        return None
+    try:
+        if time() - entry['checked'] > max_age or entry['browser'] not in BROWSERS:
+            return None
+        if entry['browser'] in failed_browsers(cache_path, max_age):
+            return None
+        if _fingerprint(entry['driver_path']) != entry['fingerprint']:
+            return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning(f'Driver cache {cache_path} ignored: {e}')
+        return None
+    return entry['browser'], entry['driver_path']
+
+def save_cached(cache_path, browser, driver_path, version):
+    '''
+    Save the resolved driver in the cache file, keeping the failed browsers.
+    '''
+    if not cache_path:
+        return
+    entry = {
+        'browser': browser,
+        'driver_path': driver_path,
+        'version': version,
+        'fingerprint': _fingerprint(driver_path),
+        'checked': time(),
+        'failed': _read_cache(cache_path).get('failed', {}),
+    }
+    _write_cache(cache_path, entry)
+
+def resolve(cache_path='driver_cache.json', offline=False, max_age=7 * 24 * 3600, exclude=()):
+    '''
+    Find a working driver and return (browser, driver path), or None.
+    The last driver found is reused from the cache file while it is valid.
+    Otherwise Firefox, Chrome and Edge are tried in this order, first with a
+    locally installed driver and then, unless offline, with webdriver-manager;
+    the browsers that recently failed to start (see mark_failed) come last
+    and the ones in exclude are not tried at all.
+    '''
+    cached = load_cached(cache_path, max_age)
+    if cached is not None and cached[0] not in exclude:
+        logging.info(f'Using the cached {cached[0]} driver {cached[1]}')
+        return cached
+
+    failed = failed_browsers(cache_path, max_age)
+    for browser in sorted(BROWSERS, key=lambda browser: browser in failed):
+        if browser in exclude:
+            continue
+        if not browser_installed(browser):
+            logging.info(f'{browser} not installed')
+            continue
+        candidates = [local_driver]
+        if not offline:
+            candidates.append(downloaded_driver)
+        for candidate in candidates:
+            try:
+                driver_path = candidate(browser)
+            except Exception as e:
+                logging.error(f'{browser} driver not found: {e}')
+                continue
+            version = probe(driver_path) if driver_path else None
+            if version is None:
+                continue
+            logging.info(f'Using the {browser} driver {driver_path} ({version})')
+            save_cached(cache_path, browser, driver_path, version)
+            return browser, driver_path
+
+    return None
+
+def browser_of(options):
+    '''
+    Return the browser the Selenium options are made for.
+    '''
+    from selenium import webdriver
+    if isinstance(options, webdriver.FirefoxOptions):
+        return 'firefox'
+    if isinstance(options, webdriver.EdgeOptions):
+        return 'edge'
+    return 'chrome'
+
+def service_and_options(browser, driver_path, headless=True, lean=False, memory_mb=1024):
+    '''
+    Return the Selenium Service and Options of a browser.
+    With lean the pages are loaded with the lean profile of the browser
+    (LEAN_FIREFOX_PREFS, LEAN_CHROMIUM_ARGUMENTS), the JavaScript heap is
+    capped to memory_mb and the page load ends at DOMContentLoaded: the
+    tables are awaited explicitly anyway.
+    '''
+    from selenium import webdriver
+    if browser == 'firefox':
+        from selenium.webdriver.firefox.service import Service
+        options = webdriver.FirefoxOptions()
+    elif browser == 'chrome':
+        from selenium.webdriver.chrome.service import Service
+        options = webdriver.ChromeOptions()
+    else:
+        from selenium.webdriver.edge.service import Service
+        options = webdriver.EdgeOptions()
+    if headless:
+        options.add_argument('--headless')  # Run in headless mode (no GUI)
+    if lean:
+        options.page_load_strategy = 'eager'
+        if browser == 'firefox':
+            for name, value in LEAN_FIREFOX_PREFS.items():
+                options.set_preference(name, value)
+            options.set_preference('javascript.options.mem.max', memory_mb)
+        else:
+            for argument in LEAN_CHROMIUM_ARGUMENTS:
+                options.add_argument(argument)
+            options.add_argument(f'--js-flags=--max-old-space-size={memory_mb}')
+            options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    return Service(executable_path=driver_path), options
+
+def _process_tree_rss(root_pid):
+    '''
+    Resident memory in bytes of a process and of all its descendants, read
+    from /proc (Linux only). Return None when /proc is not available.
+    '''
+    if not os.path.isdir('/proc'):
+        return None
+    children = {}
+    rss = {}
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as file:
+                # The process name may contain spaces: the fields start after its closing parenthesis
+                fields = file.read().rsplit(b')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * page_size
+
+    total = 0
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        total += rss.get(pid, 0)
+        pending += children.get(pid, [])
+    return total
+
+def browser_rss(driver):
+    '''
+    Resident memory in MB of the driver and of the browser processes it
+    started, or None if it cannot be measured.
+    '''
+    try:
+        rss = _process_tree_rss(driver.service.process.pid)
+    except (AttributeError, OSError, ValueError):
+        return None
+    return rss / 1024 / 1024 if rss is not None else None
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import logging
+import numpy as np
+from writers import UNITS_TABLE
+
+class NutrientMatrix:
+    '''
+    Every food of a run against every nutrient, in a single float32 matrix:
+    values[i, j] is the amount of columns[j] in 100 g of foods[i], NaN when
+    the food does not report it. columns holds (section, nutrient, unit).
+    '''
+    def __init__(self, foods, columns, values):
+        self.foods = foods
+        self.columns = columns
+        self.values = values
+
+    def column_names(self):
+        '''
+        Name of every column: the nutrient, followed by its section when the
+        same nutrient appears in more than one section.
+        '''
+        counts = {}
+        for section, nutrient, unit in self.columns:
+            counts[nutrient] = counts.get(nutrient, 0) + 1
+        return [nutrient if counts[nutrient] == 1 else f'{nutrient} ({section})' for section, nutrient, unit in self.columns]
+
+    @classmethod
+    def from_db(cls, db_file):
+        '''
+        Build the matrix from the section tables of a food_components database.
+        '''
+        connection = sqlite3.connect(db_file)
+        try:
+            # The section views of the normalized layout read like the wide tables
+            tables = dict(connection.execute(
+                "SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view') ORDER BY rowid"
+                ).fetchall())
+            units = {}
+            if UNITS_TABLE in tables:
+                units = {(section, nutrient): unit for section, nutrient, unit in connection.execute(
+                    f'SELECT "Section", "Nutrient", "Unit" FROM "{UNITS_TABLE}"'
+                    )}
+
+            foods = {}
+            columns = []
+            sections = []
+            for table in tables:
+                table_columns = [row[1] for row in connection.execute(f'PRAGMA table_info("{table}")')]
+                if 'Food' not in table_columns:
+                    continue
+                names = [column for column in table_columns if column != 'Food']
+                column_list = ', '.join(f'"{column}"' for column in ['Food'] + names)
+                order = ' ORDER BY rowid' if tables[table] == 'table' else ''
+                rows = connection.execute(f'SELECT {column_list} FROM "{table}"{order}').fetchall()
+                for row in rows:
+                    foods.setdefault(row[0], len(foods))
+                sections.append((len(columns), names, rows))
+                columns += [(table, nutrient, units.get((table, nutrient))) for nutrient in names]
+        finally:
+            connection.close()
+
+        values = np.full((len(foods), len(columns)), np.nan, dtype=np.float32)
+        for first, names, rows in sections:
+            if not rows:
+                continue
+            index = np.fromiter((foods[row[0]] for row in rows), dtype=np.intp, count=len(rows))
+            block = np.array([row[1:] for row in rows], dtype=np.float64)
+            values[index, first:first + len(names)] = block
+        return cls(list(foods), columns, values)
+
+    def to_arrow(self):
+        '''
+        Return the matrix as a pyarrow Table: a dictionary-encoded Food column
+        and a float32 column per nutrient, with its section and unit in the
+        field metadata.
+        '''
+        pa = _pyarrow()
+        fields = [pa.field('Food', pa.dictionary(pa.int32(), pa.string()))]
+        arrays = [pa.array(self.foods, type=pa.string()).dictionary_encode()]
+        for (section, nutrient, unit), name, column in zip(self.columns, self.column_names(), self.values.T):
+            metadata = {'section': section, 'nutrient': nutrient, 'unit': unit or ''}
+            fields.append(pa.field(name, pa.float32(), metadata=metadata))
+            arrays.append(pa.array(column, type=pa.float32(), from_pandas=True))
+        return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+    @classmethod
+    def from_arrow(cls, table):
+        '''
+        Build the matrix back from a Table written by to_arrow.
+        '''
+        foods = table.column('Food').to_pylist()
+        fields = [field for field in table.schema if field.name != 'Food']
+        columns = [
+            (field.metadata[b'section'].decode(), field.metadata[b'nutrient'].decode(), field.metadata[b'unit'].decode() or None)
+            for field in fields
+            ]
+        values = np.empty((len(foods), len(fields)), dtype=np.float32)
+        for j, field in enumerate(fields):
+            values[:, j] = table.column(field.name).to_numpy()
+        return cls(foods, columns, values)
+
+def _pyarrow():
+    '''
+    Import pyarrow, an optional dependency only needed by the exports.
+    '''
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('The Parquet/Arrow export needs pyarrow: pip install pyarrow') from None
+    return pyarrow
+
+def write_matrix(matrix, path):
+    '''
+    Save a NutrientMatrix as Parquet (.parquet) or as an uncompressed Arrow
+    IPC file (.arrow, .feather), which can be memory-mapped without copies.
+    '''
+    pa = _pyarrow()
+    table = matrix.to_arrow()
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, use_dictionary=['Food'])
+    else:
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    logging.info(f'Matrix of {len(matrix.foods)} foods and {len(matrix.columns)} nutrients saved in {path}')
+
+def read_matrix(path):
+    '''
+    Load a file saved by write_matrix as a pyarrow Table, memory-mapped.
+    '''
+    pa = _pyarrow()
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_table(path, memory_map=True)
+    # The columns of the table point into the mapped file, which stays open as long as they do
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+def export_db(db_file, path):
+    '''
+    Save the nutrient matrix of a food_components database in path.
+    '''
+    if not os.path.exists(db_file):
+        logging.error(f'Nothing to export, {db_file} does not exist')
+        return None
+    matrix = NutrientMatrix.from_db(db_file)
+    write_matrix(matrix, path)
+    return matrix
@@ -0,0 +1,98 @@
+import os
+import gzip
+import logging
+import sqlite3
+import threading
+from time import time
+
+class FetchCache:
+    '''
+    Persistent cache of the fetched pages, stored gzipped in a SQLite file.
+    Entries older than ttl seconds are treated as missing, and when the
+    cache grows over max_bytes the least recently used entries are evicted.
+    '''
+    def __init__(self, path='cache/fetch_cache.db', ttl=30 * 24 * 3600, max_bytes=500 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+            'created REAL NOT NULL, accessed REAL NOT NULL)'
+            )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self._size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def get(self, key):
+        '''
+        Return the cached text for a key, or None if missing or expired.
+        '''
+        now = time()
+        with self._lock:
+            row = self._connection.execute('SELECT value, size, created FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is not None and now - row[2] > self.ttl:
+                self._connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self._connection.commit()
+                self._size -= row[1]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+            self._connection.commit()
+            self.hits += 1
+        return gzip.decompress(row[0]).decode('utf-8')
+
+    def put(self, key, text):
+        '''
+        Save a text in the cache, evicting the least recently used entries if needed.
+        '''
+        value = gzip.compress(text.encode('utf-8'))
+        now = time()
+        with self._lock:
+            old = self._connection.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            self._connection.execute(
+                'INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, value, len(value), now, now)
+                )
+            self._size += len(value) - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        '''
+        Drop the least recently used entries until the cache fits in max_bytes.
+        '''
+        rows = self._connection.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._connection.executemany('DELETE FROM entries WHERE key = ?', evicted)
+        self.evictions += len(evicted)
+
+    def stats(self):
+        '''
+        Return the cache counters as a dictionary.
+        '''
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def close(self):
+        '''
+        Close the cache file and log the statistics.
+        '''
+        with self._lock:
+            self._connection.close()
+        logging.info(f'Fetch cache closed: {self.hits} hits, {self.misses} misses, {self.evictions} evictions')
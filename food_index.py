@@ -0,0 +1,101 @@
+import os
+import re
+import json
+import logging
+import threading
+
+WORD_PATTERN = re.compile(r"[a-z0-9%']+")
+
+def singular(word):
+    '''
+    Rough English singular of a word, enough to match "apples" with "apple".
+    '''
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'ches', 'shes', 'xes', 'sses')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+def normalize_query(food):
+    '''
+    Normalize a food name so that equivalent queries share the same entry:
+    lowercase, punctuation and extra whitespace removed, words made singular.
+    '''
+    return ' '.join(singular(word) for word in WORD_PATTERN.findall(food.lower()))
+
+def unique_queries(foods):
+    '''
+    Drop the empty names and the names equivalent to an earlier one, keeping the order.
+    '''
+    seen = {}
+    for food in foods:
+        query = normalize_query(food)
+        if query and query not in seen:
+            seen[query] = food
+    return list(seen.values())
+
+class ResolutionIndex:
+    '''
+    Persistent index of the resolved searches: normalized food query ->
+    list of [description, url] found on the FDC site. Searches without
+    results are not kept, so a missing food is searched again by the next run.
+    '''
+    def __init__(self, path='food_index.json'):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._changed = False
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as file:
+                self._entries = json.load(file)
+
+    def get(self, food):
+        '''
+        Return the results known for a food, or None if it was never found.
+        '''
+        with self._lock:
+            results = self._entries.get(normalize_query(food))
+            # Empty results saved by older versions are searched again as well
+            if not results:
+                results = None
+                self.misses += 1
+            else:
+                self.hits += 1
+            return results
+
+    def add(self, food, results):
+        '''
+        Record the results of a search, unless it found nothing.
+        '''
+        if not results:
+            return
+        with self._lock:
+            self._entries[normalize_query(food)] = results
+            self._changed = True
+
+    def urls(self):
+        '''
+        Return {url: description} for every food found so far.
+        '''
+        with self._lock:
+            return {url: description for results in self._entries.values() for description, url in results if url is not None}
+
+    def save(self):
+        '''
+        Write the index to disk if it changed.
+        '''
+        with self._lock:
+            if not self._changed:
+                return
+            temporary_path = self.path + '.tmp'
+            with open(temporary_path, 'w') as file:
+                json.dump(self._entries, file, indent=1, ensure_ascii=False)
+            os.replace(temporary_path, self.path)
+            self._changed = False
+        logging.info(f'Resolution index saved: {len(self._entries)} queries, {self.hits} hits, {self.misses} misses')
@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import logging
+import threading
+from time import time
+from contextlib import contextmanager
+
+class JobQueue:
+    '''
+    Foods to search and URLs to extract, shared by several worker processes,
+    on one host or on several hosts sharing the folder of the queue file.
+    A worker leases a few jobs at a time and keeps the leases alive with
+    heartbeats; the jobs of a worker that stops sending them (a crash, a
+    lost host) go back to 'pending' when their lease expires, and a failed
+    job is retried until max_attempts.
+    Every job is 'pending', 'leased', 'done', 'failed' or 'skipped'.
+    '''
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # No WAL: the file may be on a network filesystem, where only the rollback journal is safe.
+        # isolation_level=None to open the transactions explicitly with BEGIN IMMEDIATE
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'kind TEXT NOT NULL, key TEXT NOT NULL, status TEXT NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_until REAL, '
+            'food TEXT, error TEXT, updated REAL, '
+            'PRIMARY KEY (kind, key))'
+            )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until)')
+
+    @contextmanager
+    def _write(self):
+        '''
+        Write transaction, taking the lock of the file at once so that two
+        workers cannot lease the same job.
+        '''
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._connection
+                self._connection.execute('COMMIT')
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def add(self, kind, keys, foods=None):
+        '''
+        Queue jobs, leaving alone the ones already known: every worker can
+        add the same lists, they are queued only once.
+        foods optionally maps a URL to the food description found by the search.
+        '''
+        foods = foods or {}
+        with self._write() as connection:
+            connection.executemany(
+                'INSERT OR IGNORE INTO jobs (kind, key, status, food, updated) VALUES (?, ?, ?, ?, ?)',
+                [(kind, key, 'pending', foods.get(key), time()) for key in keys]
+                )
+
+    def lease(self, worker, count=1):
+        '''
+        Lease up to count pending jobs to a worker, URLs before foods, after
+        requeueing the jobs whose lease expired. Return [(kind, key)].
+        '''
+        now = time()
+        with self._write() as connection:
+            # A job that keeps killing its workers ends up failed as well
+            requeued = connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                "worker = NULL, lease_until = NULL, error = 'lease expired' "
+                "WHERE status = 'leased' AND lease_until < ?", (self.max_attempts, now)
+                ).rowcount
+            rows = connection.execute(
+                "SELECT kind, key FROM jobs WHERE status = 'pending' ORDER BY kind = 'food', updated LIMIT ?", (count,)
+                ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+                "WHERE kind = ? AND key = ?",
+                [(worker, now + self.lease_seconds, now, kind, key) for kind, key in rows]
+                )
+        if requeued:
+            logging.warning(f'Job queue: {requeued} jobs with an expired lease queued again')
+        return rows
+
+    def heartbeat(self, worker):
+        '''
+        Extend the leases of a worker.
+        '''
+        with self._write() as connection:
+            connection.execute(
+                "UPDATE jobs SET lease_until = ? WHERE worker = ? AND status = 'leased'",
+                (time() + self.lease_seconds, worker)
+                )
+
+    def done(self, kind, key, food=None):
+        with self._write() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'done', lease_until = NULL, food = COALESCE(?, food), updated = ? "
+                "WHERE kind = ? AND key = ?", (food, time(), kind, key)
+                )
+
+    def failed(self, kind, key, error=None):
+        '''
+        Put a job back in the queue, or mark it failed after max_attempts.
+        '''
+        with self._write() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                "worker = NULL, lease_until = NULL, error = ?, updated = ? "
+                "WHERE kind = ? AND key = ? AND status = 'leased'", (self.max_attempts, error, time(), kind, key)
+                )
+
+    def skipped(self, kind, key):
+        with self._write() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'skipped', lease_until = NULL, updated = ? WHERE kind = ? AND key = ?",
+                (time(), kind, key)
+                )
+
+    def food_of(self, kind, key):
+        '''
+        Return the food description recorded for a job, or None.
+        '''
+        with self._lock:
+            row = self._connection.execute('SELECT food FROM jobs WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        return row[0] if row else None
+
+    def idle(self):
+        '''
+        Return True when no job is pending or leased: the work is over.
+        '''
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'leased')"
+                ).fetchone()
+        return row[0] == 0
+
+    def counts(self):
+        '''
+        Return {(kind, status): number of jobs}.
+        '''
+        with self._lock:
+            rows = self._connection.execute('SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status').fetchall()
+        return {(kind, status): count for kind, status, count in rows}
+
+    def close(self):
+        counts = self.counts()
+        with self._lock:
+            self._connection.close()
+        logging.info(f'Job queue closed: {counts}')
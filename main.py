@@ -1,12 +1,83 @@
 import os
+import glob
+import csv
 import logging
 from datetime import datetime
+import queue
+import socket
+import threading
+from time import sleep
+from functools import partial
+import drivers
 import tables_reader
+from driver_pool import DriverPool
+from writers import ResultWriter
+from fetch_cache import FetchCache
+from food_index import ResolutionIndex, unique_queries
+from search_index import build_search_index
+from manifest import RunManifest, existing_foods, existing_fdc_ids
+from job_queue import JobQueue
+from snapshots import SnapshotStore, fdc_id_from_url
+import nutrients
+import metrics
 
 # Adda list of valid urls. Check example_urls.txt or directly the USDA Site
 URLS = 'example_urls.txt' # 'example_urls.txt'
 # Adda list of valid foods. Check example_corrected_foods.txt or directly the USDA Site
 CORRECTED_FOODS = '' # 'example_corrected_foods.txt'
+# Number of browsers kept warm and pages served by each one before it is restarted
+POOL_SIZE = 1
+RECYCLE_AFTER = 50
+# Number of URLs extracted concurrently, each worker with its own browser,
+# and URLs found by the searches that can wait for a free worker
+WORKERS = 1
+QUEUE_SIZE = 20
+# Folder where the rendered nutrient tables are saved ('' to disable them).
+# With REPARSE = True the outputs are rebuilt from these snapshots without any browser
+SNAPSHOTS = '' # 'snapshots'
+REPARSE = False
+# File caching the fetched pages ('' to disable it), how long they stay valid and how big it can grow
+CACHE = '' # 'cache/fetch_cache.db'
+CACHE_TTL_DAYS = 30
+CACHE_MAX_MB = 500
+# File remembering the FDC foods found for every food name ('' to disable it)
+FOOD_INDEX = 'food_index.json'
+# Results folder of an interrupted run to resume in place ('' for a new run), for example './results/20240801_120000'
+RESUME = ''
+# Resolve the food names locally with a trigram index of the FDC descriptions collected by the
+# previous runs: a description scoring at least LOCAL_SEARCH_SCORE (1.0 for the same words) spares
+# the search page, and one scoring RESCUE_SCORE is used when the site finds nothing or cannot be reached
+LOCAL_SEARCH = True
+LOCAL_SEARCH_SCORE = 0.9
+RESCUE_SCORE = 0.6
+# Database whose foods are not extracted again ('' to extract everything)
+INCREMENTAL_DB = ''
+# File remembering the WebDriver found by the last run ('' to look for it every time).
+# With OFFLINE = True only a driver installed locally (PATH or drivers folder) is used, nothing is downloaded
+DRIVER_CACHE = 'driver_cache.json'
+OFFLINE = False
+# Load the pages without images, web fonts, analytics and extensions, without waiting
+# for the full load event, and cap the JavaScript memory of every browser in MB
+LEAN_BROWSER = False
+BROWSER_MEMORY_MB = 1024
+# Layout of the database: 'wide' (a table per section, a column per nutrient) or
+# 'normalized' (foods, nutrients and food_nutrients tables, with a view per section)
+DB_LAYOUT = 'wide'
+# Also save the food x nutrient matrix of the run as 'parquet' or 'arrow' ('' to skip it, needs pyarrow)
+EXPORT = ''
+# Log every row inserted in the database (slow, for debugging)
+VERBOSE = False
+# Shared job queue ('' for a standalone run): several processes, on one host or on hosts
+# sharing its folder, split the foods and URLs and each one writes its own shard in
+# <queue folder>/shards. Leases not renewed for LEASE_SECONDS go back to the queue
+JOB_QUEUE = '' # '/shared/food_jobs.db'
+WORKER_ID = '' # '' for <host>_<pid>
+LEASE_SECONDS = 300
+JOB_BATCH = 5
+# Attempts per search, and consecutive failed searches after which the site is left alone for a while
+SEARCH_ATTEMPTS = 4
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 60
 
 def read_file(file_path):
     '''
@@ -29,6 +100,23 @@ def results_configurator():
 
     return folder_name
 
+def worker_name():
+    '''
+    Name of this process in the job queue.
+    '''
+    return WORKER_ID if WORKER_ID != '' else f'{socket.gethostname()}_{os.getpid()}'
+
+def shard_configurator():
+    '''
+    Configure the folder of the shard written by this worker, next to the job queue.
+    '''
+    queue_directory = os.path.dirname(JOB_QUEUE) or '.'
+    formatted_datetime = datetime.now().strftime('%Y%m%d_%H%M%S')
+    folder_name = f'{queue_directory}/shards/{formatted_datetime}_{worker_name()}'
+    os.makedirs(folder_name, exist_ok=True)
+
+    return folder_name
+
 def log_configurator():
     '''
     Configure and initialize the logger.
@@ -41,10 +129,322 @@ def log_configurator():
     log_file = f'{log_directory}{current_file_name}_{formatted_datetime}.log'
 
     logging.basicConfig(
-        filename=log_file, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s'
+        filename=log_file, level=logging.DEBUG if VERBOSE else logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s'
         )
     logging.info('Program started')
 
+def save_food_table(table, csv_name):
+    '''
+    Save the full table of a food, a list of rows with the headers first, in the foods folder.
+    '''
+    os.makedirs('foods', exist_ok=True)
+    csv_name = 'foods/' + csv_name.replace('/','')
+
+    # Save the table to a CSV file
+    with metrics.timer('food_csv_write'), open(csv_name, 'w', newline='') as file:
+        csv.writer(file, lineterminator=os.linesep).writerows(table)
+    logging.info(f'Data successfully saved to "{csv_name}"\n')
+
+class Run:
+    '''
+    State shared by the searches and the extractions of a run.
+    '''
+    def __init__(self, folder_name, pool, writer, manifest, cache=None, snapshots=None, index=None, breaker=None, search_index=None):
+        self.folder_name = folder_name
+        self.pool = pool
+        self.writer = writer
+        self.manifest = manifest
+        self.cache = cache
+        self.snapshots = snapshots
+        self.index = index
+        self.breaker = breaker
+        self.search_index = search_index
+
+def search_locally(run, food, min_score):
+    '''
+    Resolve a food name with the best description of the local search index
+    scoring at least min_score. Return the [description, url] results, or None.
+    '''
+    if run.search_index is None:
+        return None
+    with metrics.timer('local_search'):
+        match = run.search_index.match(food, min_score)
+    if match is None:
+        return None
+    score, description, url = match
+    logging.info(f'"{food}" resolved locally to "{description}" (score {score:.2f})')
+    results = [[description, url]]
+    tables_reader.write_search_results(food, results, run.folder_name)
+    return results
+
+def search_one(run, food):
+    '''
+    Resolve a food name with the index, the cache, the local search index or
+    the browser, in this order, and record the URLs found in the manifest.
+    When the site finds nothing, or cannot be reached, a near match of the
+    local search index is used instead.
+    Return the [description, url] results, or None if the search failed.
+    '''
+    try:
+        results = run.index.get(food) if run.index is not None else None
+        if results is not None:
+            tables_reader.write_search_results(food, results, run.folder_name)
+        else:
+            if run.cache is not None:
+                results = tables_reader.search_food_from_cache(food, run.folder_name, run.cache)
+            local = search_locally(run, food, LOCAL_SEARCH_SCORE) if results is None else None
+            if local is not None:
+                results = local
+            else:
+                if results is None:
+                    with run.pool.driver() as driver, metrics.timer('search'):
+                        results = tables_reader.search_food(driver, food, run.folder_name, run.cache, run.breaker, SEARCH_ATTEMPTS)
+                if results is not None and run.index is not None:
+                    run.index.add(food, results)
+                if results is not None and run.search_index is not None:
+                    for description, url in results:
+                        run.search_index.add(description, url)
+    except Exception as e:
+        logging.error(f'error in the driver while searching "{food}": {e}')
+        results = None
+
+    if not results:
+        rescued = search_locally(run, food, RESCUE_SCORE)
+        if rescued is not None:
+            logging.warning(f'"{food}" not found on the site, using the near match "{rescued[0][0]}"')
+            results = rescued
+
+    if results is None:
+        run.manifest.failed('food', food)
+    else:
+        found = {url: description for description, url in results if url is not None}
+        run.manifest.add('url', list(found), found)
+        run.manifest.done('food', food)
+    return results
+
+def url_written(run, url, food, error):
+    '''
+    Record in the manifest that the rows of a URL were committed, or lost.
+    Called by the writer thread of the ResultWriter.
+    '''
+    if error is None:
+        run.manifest.done('url', url, food=food, fdc_id=fdc_id_from_url(url))
+    else:
+        run.manifest.failed('url', url, error)
+
+def extract_url(run, url):
+    '''
+    Extract a single URL with a driver of the pool, unless it is in the cache,
+    and save its full table in foods/. Return True on success.
+    The URL is only marked done in the manifest once its rows are committed.
+    '''
+    def save(amounts):
+        run.writer.save(amounts, lambda food, error: url_written(run, url, food, error))
+
+    with metrics.url_context(url), metrics.timer('url_total'):
+        try:
+            cached = None
+            if run.cache is not None:
+                cached = tables_reader.extract_table_from_cache(url, run.folder_name, save, run.cache)
+
+            if cached is not None:
+                table, csv_name = cached
+            else:
+                with run.pool.driver() as driver:
+                    table, csv_name = tables_reader.extract_table_data(
+                        driver, url, run.folder_name, save, run.snapshots, run.cache
+                        )
+
+            # Headers only, or nothing at all on error
+            if len(table) < 2:
+                raise ValueError('no nutrient table extracted')
+            save_food_table(table, csv_name)
+            return True
+        except Exception as e:
+            logging.error(f'error in the driver while using {url}: {e}\n')
+            run.manifest.failed('url', url, str(e))
+            return False
+
+def is_known(url, food, known_foods, known_ids):
+    '''
+    Return True if the food of a URL is in the incremental database, by its
+    description (known from a search) or by its FDC id.
+    '''
+    return food in known_foods or fdc_id_from_url(url) in known_ids
+
+def enqueue_url(run, url_queue, seen, url, known_foods, known_ids):
+    '''
+    Queue a URL for extraction unless it is in seen (already queued, or done
+    in the run being resumed) or belongs to a food of the incremental
+    database. Blocks when the extraction workers are behind.
+    '''
+    if url in seen:
+        return
+    seen.add(url)
+    if is_known(url, run.manifest.food_of('url', url), known_foods, known_ids):
+        run.manifest.skipped('url', url)
+        return
+    url_queue.put(url)
+
+def produce_urls(run, foods, urls, url_queue, workers, known_foods, known_ids):
+    '''
+    Search stage of the pipeline: queue the URLs already known, then search
+    the foods and queue the URLs found as soon as each search ends.
+    Finally queue one stop marker per extraction worker.
+    '''
+    try:
+        # The URLs finished by the run being resumed, loaded once
+        seen = run.manifest.finished('url')
+        for url in urls:
+            enqueue_url(run, url_queue, seen, url, known_foods, known_ids)
+
+        # Skip the foods already searched by the run being resumed
+        for food in run.manifest.remaining('food', foods):
+            results = search_one(run, food)
+            for description, url in results or []:
+                if url is not None:
+                    enqueue_url(run, url_queue, seen, url, known_foods, known_ids)
+
+        if run.index is not None:
+            run.index.save()
+    except Exception as e:
+        logging.error(f'Search stage stopped: {e}')
+    finally:
+        for _ in range(workers):
+            url_queue.put(None)
+
+def consume_urls(run, url_queue):
+    '''
+    Extraction stage of the pipeline: extract the queued URLs until the stop marker.
+    '''
+    while True:
+        url = url_queue.get()
+        if url is None:
+            break
+        extract_url(run, url)
+
+def next_driver(failed, options, error):
+    '''
+    Fallback of the DriverPool: the browser of options does not start.
+    Remember it in the driver cache and set up the next browser, skipping
+    the ones that failed during this run. Return (service, options) or None.
+    '''
+    browser = drivers.browser_of(options)
+    failed.add(browser)
+    drivers.mark_failed(DRIVER_CACHE, browser)
+    logging.error(f'{browser} does not start, trying the next browser: {error}')
+    service, options = tables_reader.set_up_driver(DRIVER_CACHE, OFFLINE, LEAN_BROWSER, BROWSER_MEMORY_MB, exclude=failed)
+    if service == '':
+        return None
+    return service, options
+
+def send_heartbeats(jobs, worker, stop):
+    '''
+    Renew the leases of this worker until stop is set.
+    '''
+    while not stop.wait(LEASE_SECONDS / 3):
+        try:
+            jobs.heartbeat(worker)
+        except Exception as e:
+            logging.error(f'Heartbeat not sent: {e}')
+
+def work_jobs(run, jobs, worker, known_foods, known_ids):
+    '''
+    Worker of the shared job queue: lease JOB_BATCH jobs at a time, search the
+    foods (queueing the URLs found) and extract the URLs, until no job is left
+    in the queue. The URLs are marked done only once their rows are committed
+    to the shard, so the jobs of a crashed worker are never lost; the URLs
+    whose rows could not be saved are queued again.
+    '''
+    while True:
+        leased = jobs.lease(worker, JOB_BATCH)
+        if not leased:
+            if jobs.idle():
+                break
+            # Other workers are still busy and may queue more URLs
+            sleep(1)
+            continue
+
+        extracted = []
+        for kind, key in leased:
+            run.manifest.add(kind, [key])
+            if kind == 'food':
+                results = search_one(run, key)
+                if results is None:
+                    jobs.failed('food', key)
+                    continue
+                found = {url: description for description, url in results if url is not None}
+                jobs.add('url', list(found), found)
+                jobs.done('food', key)
+            elif is_known(key, jobs.food_of('url', key), known_foods, known_ids):
+                run.manifest.skipped('url', key)
+                jobs.skipped('url', key)
+            elif extract_url(run, key):
+                extracted.append(key)
+            else:
+                jobs.failed('url', key, 'extraction failed')
+
+        if not run.writer.sync():
+            logging.warning('Rows of leased URLs were lost, they are queued again')
+        for url in extracted:
+            if run.manifest.status('url', url) == 'done':
+                jobs.done('url', url, run.manifest.food_of('url', url))
+            else:
+                jobs.failed('url', url, 'rows not saved')
+
+def reparse(folder_name):
+    '''
+    Rebuild the .db, .csv and foods/ outputs from the saved snapshots, without a browser.
+    '''
+    writer = ResultWriter(folder_name, layout=DB_LAYOUT)
+    pages = 0
+    for url, html in SnapshotStore(SNAPSHOTS).snapshots():
+        try:
+            food, header_list, rows = nutrients.parse_table_html(html)
+            table = tables_reader.process_table(food, header_list, rows, writer.save)
+            save_food_table(table, food + '.csv')
+            pages += 1
+        except Exception as e:
+            logging.error(f'An error occurred parsing the snapshot of {url}: {e}')
+    writer.close()
+    print(f'Rebuilt {pages} foods from the snapshots in {SNAPSHOTS}\n')
+    matrix_exporter(folder_name)
+    metrics_exporter(folder_name)
+
+def matrix_exporter(folder_name):
+    '''
+    Save the food x nutrient matrix of the run in the EXPORT format.
+    '''
+    if EXPORT == '':
+        return
+    import export
+    prefix = folder_name + '/food_components_' + folder_name.split('/')[-1]
+    try:
+        with metrics.timer('matrix_export'):
+            matrix = export.export_db(prefix + '.db', f'{folder_name}/food_matrix_{folder_name.split("/")[-1]}.{EXPORT}')
+    except ImportError as e:
+        logging.error(f'Matrix not exported: {e}')
+        return
+    if matrix is not None:
+        print(f'Matrix of {len(matrix.foods)} foods and {len(matrix.columns)} nutrients exported as {EXPORT}\n')
+
+def metrics_exporter(folder_name):
+    '''
+    Save the stage timings of the run as JSON and as a Prometheus textfile,
+    and print the per-stage summary.
+    '''
+    prefix = folder_name + '/metrics_' + folder_name.split('/')[-1]
+    metrics.METRICS.write_json(prefix + '.json')
+    metrics.METRICS.write_prometheus(prefix + '.prom')
+
+    print(f'{"Stage":<18}{"count":>7}{"total s":>10}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}')
+    for stage, values in metrics.METRICS.summary().items():
+        print(f'{stage:<18}{values["count"]:>7}{values["total"]:>10.2f}'
+              f'{values["p50"] * 1000:>10.1f}{values["p90"] * 1000:>10.1f}{values["p99"] * 1000:>10.1f}')
+    for name, values in metrics.METRICS.summary(values=True).items():
+        print(f'{name:<18}{values["count"]:>7}{"":>10}{values["p50"]:>10.1f}{values["p90"]:>10.1f}{values["p99"]:>10.1f}')
+    print()
+
 def execution_time(func):
     '''
     Decorator that prints the current date and time before and after
@@ -68,11 +468,28 @@ def main():
     # Configure and initialize the logger file
     log_configurator()
 
-    # Configure the folder where to put the results
-    folder_name = results_configurator()
+    # Reparsing needs the snapshots folder: SnapshotStore would create an empty one and rebuild nothing
+    if REPARSE and (SNAPSHOTS == '' or not os.path.isdir(SNAPSHOTS)):
+        logging.error(f'REPARSE needs SNAPSHOTS to point to an existing snapshots folder, not "{SNAPSHOTS}"')
+        print(f'Nothing to reparse: set SNAPSHOTS to the folder of the saved snapshots (now "{SNAPSHOTS}")\n')
+        return
+
+    # Configure the folder where to put the results (the shard of this worker
+    # with a job queue), or reuse the one of the run to resume
+    if RESUME != '':
+        folder_name = RESUME
+    elif JOB_QUEUE != '':
+        folder_name = shard_configurator()
+    else:
+        folder_name = results_configurator()
+
+    if REPARSE:
+        reparse(folder_name)
+        logging.info('Program ended successfully')
+        return
 
     # Set up the Driver
-    service, options = tables_reader.set_up_driver()
+    service, options = tables_reader.set_up_driver(DRIVER_CACHE, OFFLINE, LEAN_BROWSER, BROWSER_MEMORY_MB)
 
     if service != '' and options != '':
         # Read eated foods or the corrected Version or None of them
@@ -83,66 +500,119 @@ def main():
         else:
             foods = read_file(CORRECTED_FOODS)
 
-        #Obtaining URLS from file
-        try:
-            # Initialize the WebDriver
-            driver = tables_reader.initialize_driver(service, options)
-
-            counter = 0
-            for food in foods:
-                counter += 1
-                if counter == 50:
-                    counter = 0
-                    driver = tables_reader.initialize_driver(service, options)
-
-                tables_reader.search_food(driver, food, folder_name)
+        # Keep the browsers warm across the search and extraction stages,
+        # with one more browser for the searches running alongside the extractions
+        pool = DriverPool(
+            service, options, size=max(POOL_SIZE, WORKERS + (1 if foods else 0)), max_pages=RECYCLE_AFTER,
+            fallback=partial(next_driver, set()),
+            )
+        cache = None
+        if CACHE != '':
+            cache = FetchCache(CACHE, ttl=CACHE_TTL_DAYS * 24 * 3600, max_bytes=CACHE_MAX_MB * 1024 * 1024)
+        run = Run(
+            folder_name, pool, ResultWriter(folder_name, layout=DB_LAYOUT), RunManifest(folder_name),
+            cache=cache,
+            snapshots=SnapshotStore(SNAPSHOTS) if SNAPSHOTS != '' else None,
+            index=ResolutionIndex(FOOD_INDEX) if FOOD_INDEX != '' else None,
+            # Shared by all the searches of the run
+            breaker=tables_reader.CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN),
+            )
+        if LOCAL_SEARCH and foods:
+            with metrics.timer('search_index_build'):
+                run.search_index = build_search_index('./results/', run.index, CORRECTED_FOODS)
 
-            driver.quit()
-        except Exception as e:
-            logging.error(f'error in the driver while searching "{food}": {e}')
-        finally:
-            driver.quit()
+        # Equivalent names ('Apples', ' apple ') are searched only once
+        foods = unique_queries(foods)
 
-        # Read URLs created from eated foods or URLS file
+        # URLs of the URLS file, or found by the run being resumed
         if URLS == '':
-            urls = read_file(folder_name + '/urls_' + folder_name.split('/')[-1] + '.txt')
+            urls_file = folder_name + '/urls_' + folder_name.split('/')[-1] + '.txt'
+            urls = read_file(urls_file) if os.path.exists(urls_file) else []
         else:
             urls = read_file(URLS)
+        urls = list(dict.fromkeys(url for url in urls if url != ''))
+        known_urls = run.index.urls() if run.index is not None else None
 
-        # Search the informations in the URLs
-        for url in urls:
-            try:
-                # Initialize the WebDriver
-                driver = tables_reader.initialize_driver(service, options)
-                        
-                df, csv_name = tables_reader.extract_table_data(driver, url, folder_name)
-                
-                os.makedirs('foods', exist_ok=True)
-                csv_name = 'foods/' + csv_name.replace('/','')
-
-                # Save the DataFrame to a CSV file
-                df.to_csv(csv_name, index=False)
-                logging.info(f'Data successfully saved to "{csv_name}"\n')
-            except:
-                logging.error(f'error in the driver while using {url}\n')
-            finally:
-                # Ensure the WebDriver is properly closed
-                driver.quit()
-        
-        logging.info('Program ended successfully')
+        # Foods the target database already has are not extracted again: their
+        # FDC ids come from the manifests of the runs that extracted them
+        known_foods, known_ids = set(), set()
+        if INCREMENTAL_DB != '':
+            known_foods = existing_foods(INCREMENTAL_DB)
+            manifest_files = set(glob.glob('./results/*/manifest_*.db'))
+            manifest_files.update(glob.glob(os.path.join(os.path.dirname(INCREMENTAL_DB), 'manifest_*.db')))
+            known_ids = existing_fdc_ids(known_foods, sorted(manifest_files))
 
-def unique_foods_creator():
-    file_1 = read_file('example_urls.txt')
-    file_2 = read_file('example_urls.txt')
-    foods = file_1 + file_2
+        if JOB_QUEUE != '':
+            # Every worker queues the same lists, only the missing jobs are added
+            jobs = JobQueue(JOB_QUEUE, LEASE_SECONDS)
+            jobs.add('food', foods)
+            jobs.add('url', urls, known_urls)
+            worker = worker_name()
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=send_heartbeats, args=(jobs, worker, stop), name='heartbeat', daemon=True)
+            heartbeat.start()
+            workers = [
+                threading.Thread(target=work_jobs, args=(run, jobs, worker, known_foods, known_ids), name=f'worker_{i}')
+                for i in range(WORKERS)
+                ]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            stop.set()
+            if run.index is not None:
+                run.index.save()
+            counts = jobs.counts()
+            jobs.close()
+            print(f'Job queue: {counts.get(("url", "done"), 0)} URLs done, {counts.get(("url", "failed"), 0)} failed, '
+                  f'{counts.get(("url", "pending"), 0) + counts.get(("url", "leased"), 0)} left\n')
+        else:
+            run.manifest.add('food', foods)
+            run.manifest.add('url', urls, known_urls)
 
-    unique_foods = {}
-    for food in foods:
-        unique_foods[food] = 0
+            # The URLs found by the searches flow straight to the extraction workers,
+            # which funnel the results to a single writer. The urls file is only an audit trail
+            url_queue = queue.Queue(maxsize=QUEUE_SIZE)
+            workers = [
+                threading.Thread(target=consume_urls, args=(run, url_queue), name=f'worker_{i}')
+                for i in range(WORKERS)
+                ]
+            for thread in workers:
+                thread.start()
+            produce_urls(run, foods, urls, url_queue, WORKERS, known_foods, known_ids)
+            for thread in workers:
+                thread.join()
+        run.writer.close()
+
+        pool.close()
+        stats = pool.stats()
+        print(f'Driver pool: {stats["hits"]} hits, {stats["launches"]} launches, {stats["recycles"]} recycles\n')
+        if cache is not None:
+            cache.close()
+            stats = cache.stats()
+            print(f'Fetch cache: {stats["hits"]} hits, {stats["misses"]} misses, {stats["evictions"]} evictions\n')
+        counts = run.manifest.counts()
+        run.manifest.close()
+        print(f'URLs: {counts.get(("url", "done"), 0)} done, {counts.get(("url", "failed"), 0)} failed, '
+              f'{counts.get(("url", "skipped"), 0)} skipped\n')
+        matrix_exporter(folder_name)
+        metrics_exporter(folder_name)
+        logging.info('Program ended successfully')
+
+def unique_foods_creator(file_paths=('example_urls.txt',), output='unique_foods.txt'):
+    '''
+    Add the foods or URLs of file_paths to output, skipping the ones already there.
+    '''
+    existing = read_file(output) if os.path.exists(output) else []
+    lines = []
+    for file_path in file_paths:
+        lines += read_file(file_path)
 
-    for food in unique_foods:
-        with open('unique_foods.txt', 'a') as file:
-            file.write(f'{food}\n')
+    unique_foods = dict.fromkeys(lines)
+    with open(output, 'a') as file:
+        for food in unique_foods:
+            if food not in existing:
+                file.write(f'{food}\n')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import logging
+import threading
+from time import time
+
+class RunManifest:
+    '''
+    Status of every food and URL of a run, saved in the results folder so
+    that an interrupted run can be resumed in place.
+    Every item is 'pending', 'done', 'failed' or 'skipped', with its number
+    of attempts and, for the URLs, the food description and FDC id.
+    '''
+    def __init__(self, folder_name):
+        self.path = folder_name + '/manifest_' + folder_name.split('/')[-1] + '.db'
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            'kind TEXT NOT NULL, key TEXT NOT NULL, status TEXT NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, food TEXT, fdc_id TEXT, error TEXT, updated REAL, '
+            'PRIMARY KEY (kind, key))'
+            )
+        self._connection.commit()
+
+    def add(self, kind, keys, foods=None):
+        '''
+        Register items as pending, leaving alone the ones already known.
+        foods optionally maps a URL to the food description found by the search.
+        '''
+        foods = foods or {}
+        with self._lock:
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO items (kind, key, status, food, updated) VALUES (?, ?, ?, ?, ?)',
+                [(kind, key, 'pending', foods.get(key), time()) for key in keys]
+                )
+            if foods:
+                self._connection.executemany(
+                    'UPDATE items SET food = ? WHERE kind = ? AND key = ? AND food IS NULL',
+                    [(food, kind, key) for key, food in foods.items()]
+                    )
+            self._connection.commit()
+
+    def finished(self, kind):
+        '''
+        Return the set of the keys that are done or skipped.
+        '''
+        with self._lock:
+            return {key for key, in self._connection.execute(
+                "SELECT key FROM items WHERE kind = ? AND status IN ('done', 'skipped')", (kind,)
+                )}
+
+    def remaining(self, kind, keys):
+        '''
+        Return the keys, in the given order, that are not done or skipped yet.
+        '''
+        finished = self.finished(kind)
+        return [key for key in keys if key not in finished]
+
+    def food_of(self, kind, key):
+        '''
+        Return the food description recorded for an item, or None.
+        '''
+        with self._lock:
+            row = self._connection.execute('SELECT food FROM items WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        return row[0] if row else None
+
+    def status(self, kind, key):
+        '''
+        Return the status of an item, or None if it is not known.
+        '''
+        with self._lock:
+            row = self._connection.execute('SELECT status FROM items WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        return row[0] if row else None
+
+    def _update(self, kind, key, status, **fields):
+        columns = ''.join(f', {column} = COALESCE(?, {column})' for column in fields)
+        attempts = ', attempts = attempts + 1' if status in ('done', 'failed') else ''
+        with self._lock:
+            self._connection.execute(
+                f'UPDATE items SET status = ?, updated = ?{attempts}{columns} WHERE kind = ? AND key = ?',
+                (status, time(), *fields.values(), kind, key)
+                )
+            self._connection.commit()
+
+    def done(self, kind, key, food=None, fdc_id=None):
+        self._update(kind, key, 'done', food=food, fdc_id=fdc_id)
+
+    def failed(self, kind, key, error=None):
+        self._update(kind, key, 'failed', error=error)
+
+    def skipped(self, kind, key):
+        self._update(kind, key, 'skipped')
+
+    def counts(self):
+        '''
+        Return {(kind, status): number of items}.
+        '''
+        with self._lock:
+            rows = self._connection.execute('SELECT kind, status, COUNT(*) FROM items GROUP BY kind, status').fetchall()
+        return {(kind, status): count for kind, status, count in rows}
+
+    def close(self):
+        counts = self.counts()
+        with self._lock:
+            self._connection.close()
+        logging.info(f'Run manifest closed: {counts}')
+
+def existing_fdc_ids(foods, manifest_files):
+    '''
+    Return the FDC ids of the foods, read from run manifests, which record
+    the FDC id and the food description of every URL extracted.
+    '''
+    fdc_ids = set()
+    for manifest_file in manifest_files:
+        try:
+            connection = sqlite3.connect(manifest_file)
+            try:
+                fdc_ids.update(fdc_id for fdc_id, food in connection.execute(
+                    "SELECT fdc_id, food FROM items WHERE kind = 'url' AND status = 'done' AND fdc_id IS NOT NULL"
+                    ) if food in foods)
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logging.warning(f'Manifest {manifest_file} not read: {e}')
+    return fdc_ids
+
+def existing_foods(db_file):
+    '''
+    Return the set of foods present in any section table (or view, for the
+    normalized layout) of a food_components database.
+    '''
+    if not os.path.exists(db_file):
+        return set()
+    connection = sqlite3.connect(db_file)
+    try:
+        foods = set()
+        tables = [name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")]
+        for table in tables:
+            columns = [row[1] for row in connection.execute(f'PRAGMA table_info("{table}")')]
+            if 'Food' in columns:
+                foods.update(food for food, in connection.execute(f'SELECT "Food" FROM "{table}"'))
+        return foods
+    finally:
+        connection.close()
@@ -0,0 +1,245 @@
+'''
+Merge the databases of many runs into a single master database.
+
+    python3 merge.py                                  # every results/*/food_components_*.db
+    python3 merge.py --output master.db run1.db run2.db
+    python3 merge.py --layout normalized
+
+The runs are merged from the oldest to the newest (timestamp in the file
+name, else modification time), so the newest values of a food win. Every
+run is attached to the master database and copied with a few INSERT ...
+SELECT statements in one transaction: no row goes through Python.
+'''
+import os
+import re
+import glob
+import sqlite3
+import logging
+import argparse
+from time import perf_counter
+from writers import BULK_LOAD_PRAGMAS, NORMALIZED_SCHEMA, UNITS_TABLE, UNITS_SCHEMA, section_views, _missing_columns, _quote
+
+SOURCES = 'results/*/food_components_*.db'
+OUTPUT = 'results/food_components_master.db'
+
+def run_time(db_file):
+    '''
+    Sort key of a run database: the timestamp in its name, else its modification time.
+    '''
+    match = re.search(r'(\d{8}_\d{6})', os.path.basename(db_file))
+    return (match.group(1) if match else '', os.path.getmtime(db_file))
+
+def _objects(connection, schema):
+    '''
+    Return {name: type} of the tables and views of a database, in creation order.
+    '''
+    return dict(connection.execute(
+        f"SELECT name, type FROM {schema}.sqlite_master WHERE type IN ('table', 'view') "
+        "AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+        ).fetchall())
+
+def _columns(connection, schema, table):
+    return [row[1] for row in connection.execute(f'PRAGMA {schema}.table_info({_quote(table)})')]
+
+def _sections(connection, schema):
+    '''
+    Return {section: nutrient columns} of a database: its section tables,
+    or the section views of the normalized layout.
+    '''
+    sections = {}
+    for name in _objects(connection, schema):
+        columns = _columns(connection, schema, name)
+        if 'Food' in columns:
+            sections[name] = [column for column in columns if column != 'Food']
+    return sections
+
+def layout_of(connection, schema='main'):
+    '''
+    Return 'normalized', 'wide' or None for an empty database.
+    '''
+    objects = _objects(connection, schema)
+    if 'food_nutrients' in objects:
+        return 'normalized'
+    return 'wide' if objects else None
+
+def _source_units(connection):
+    '''
+    Return {(section, nutrient): unit} of the attached run.
+    '''
+    if UNITS_TABLE not in _objects(connection, 'source'):
+        return {}
+    return {
+        (section, nutrient): unit
+        for section, nutrient, unit in connection.execute(f'SELECT "Section", "Nutrient", "Unit" FROM source.{_quote(UNITS_TABLE)}')
+        }
+
+def _merge_wide(connection, columns):
+    '''
+    Copy the attached run into wide tables. A food replaces its whole row in
+    every section of the run; nutrients new to a section are added as
+    columns, NULL for the foods merged before. As in SQLite, the case of
+    the nutrient names does not matter: 'Sugars, total' of a run goes to
+    the 'Sugars, Total' column of the master database.
+    '''
+    rows = 0
+    for section, nutrients in _sections(connection, 'source').items():
+        if section not in columns:
+            nutrient_columns = ''.join(f', {_quote(nutrient)} FLOAT' for nutrient in nutrients)
+            connection.execute(f'CREATE TABLE {_quote(section)} ("Food" VARCHAR NOT NULL PRIMARY KEY{nutrient_columns})')
+            columns[section] = list(nutrients)
+        else:
+            for nutrient in _missing_columns(columns[section], nutrients):
+                connection.execute(f'ALTER TABLE {_quote(section)} ADD COLUMN {_quote(nutrient)} FLOAT')
+                columns[section].append(nutrient)
+        names = {column.lower(): column for column in columns[section]}
+        target_list = ', '.join(_quote(column) for column in ['Food'] + [names[nutrient.lower()] for nutrient in nutrients])
+        source_list = ', '.join(_quote(column) for column in ['Food'] + nutrients)
+        rows += connection.execute(
+            f'INSERT OR REPLACE INTO main.{_quote(section)} ({target_list}) '
+            f'SELECT {source_list} FROM source.{_quote(section)} WHERE "Food" IS NOT NULL'
+            ).rowcount
+
+    units = _source_units(connection)
+    if units:
+        connection.execute(UNITS_SCHEMA)
+        connection.executemany(
+            f'INSERT OR REPLACE INTO main.{_quote(UNITS_TABLE)} ("Section", "Nutrient", "Unit") VALUES (?, ?, ?)',
+            [(section, nutrient, unit) for (section, nutrient), unit in units.items()]
+            )
+    return rows
+
+def _merge_normalized(connection, source_layout):
+    '''
+    Copy the attached run into the normalized tables. The amounts of every
+    food of the run replace all the amounts merged before for that food.
+    '''
+    connection.execute('CREATE TEMP TABLE IF NOT EXISTS run_foods (name TEXT PRIMARY KEY)')
+    connection.execute('DELETE FROM temp.run_foods')
+    if source_layout == 'normalized':
+        connection.execute('INSERT OR IGNORE INTO temp.run_foods (name) SELECT name FROM source.foods')
+        connection.execute(
+            'INSERT INTO main.nutrients (section, name, unit) SELECT section, name, unit FROM source.nutrients WHERE true '
+            'ON CONFLICT (section, name) DO UPDATE SET unit = COALESCE(excluded.unit, nutrients.unit)'
+            )
+    else:
+        sections = _sections(connection, 'source')
+        for section in sections:
+            connection.execute(
+                f'INSERT OR IGNORE INTO temp.run_foods (name) SELECT "Food" FROM source.{_quote(section)} WHERE "Food" IS NOT NULL'
+                )
+        units = _source_units(connection)
+        connection.executemany(
+            'INSERT INTO main.nutrients (section, name, unit) VALUES (?, ?, ?) '
+            'ON CONFLICT (section, name) DO UPDATE SET unit = COALESCE(excluded.unit, nutrients.unit)',
+            [(section, nutrient, units.get((section, nutrient))) for section, nutrients in sections.items() for nutrient in nutrients]
+            )
+
+    connection.execute('INSERT OR IGNORE INTO main.foods (name) SELECT name FROM temp.run_foods')
+    connection.execute(
+        'DELETE FROM main.food_nutrients WHERE food_id IN '
+        '(SELECT id FROM main.foods WHERE name IN (SELECT name FROM temp.run_foods))'
+        )
+
+    if source_layout == 'normalized':
+        return connection.execute(
+            'INSERT INTO main.food_nutrients (food_id, nutrient_id, value_mg, below_detection) '
+            'SELECT foods.id, nutrients.id, amounts.value_mg, amounts.below_detection '
+            'FROM source.food_nutrients AS amounts '
+            'JOIN source.foods AS source_foods ON source_foods.id = amounts.food_id '
+            'JOIN main.foods AS foods ON foods.name = source_foods.name '
+            'JOIN source.nutrients AS source_nutrients ON source_nutrients.id = amounts.nutrient_id '
+            'JOIN main.nutrients AS nutrients ON nutrients.section = source_nutrients.section AND nutrients.name = source_nutrients.name'
+            ).rowcount
+
+    # A wide run is unpivoted one nutrient column at a time; below_detection was not recorded
+    rows = 0
+    nutrient_ids = {(section, name): nutrient_id for nutrient_id, section, name in connection.execute('SELECT id, section, name FROM main.nutrients')}
+    for section, nutrients in sections.items():
+        for nutrient in nutrients:
+            rows += connection.execute(
+                'INSERT OR REPLACE INTO main.food_nutrients (food_id, nutrient_id, value_mg, below_detection) '
+                f'SELECT foods.id, ?, source_rows.{_quote(nutrient)}, 0 FROM source.{_quote(section)} AS source_rows '
+                f'JOIN main.foods AS foods ON foods.name = source_rows."Food" WHERE source_rows.{_quote(nutrient)} IS NOT NULL',
+                (nutrient_ids[(section, nutrient)],)
+                ).rowcount
+    return rows
+
+def merge(db_files, output=OUTPUT, layout=None):
+    '''
+    Merge the run databases in db_files into output, oldest run first.
+    output is created if needed; layout ('wide' or 'normalized') is the one
+    of output when it already exists, else 'wide' unless given.
+    A run that cannot be read is skipped. Return the number of runs merged.
+    '''
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    output_path = os.path.abspath(output)
+    db_files = sorted((db_file for db_file in db_files if os.path.abspath(db_file) != output_path), key=run_time)
+
+    start = perf_counter()
+    # isolation_level=None: ATTACH and DETACH cannot run inside a transaction
+    connection = sqlite3.connect(output, isolation_level=None)
+    try:
+        for pragma in BULK_LOAD_PRAGMAS:
+            connection.execute(pragma)
+        existing_layout = layout_of(connection)
+        if existing_layout and layout and existing_layout != layout:
+            raise ValueError(f'{output} has the {existing_layout} layout, not {layout}')
+        layout = existing_layout or layout or 'wide'
+        if layout == 'normalized':
+            for statement in NORMALIZED_SCHEMA:
+                connection.execute(statement)
+        columns = _sections(connection, 'main') if layout == 'wide' else None
+
+        merged = 0
+        rows = 0
+        for db_file in db_files:
+            try:
+                connection.execute('ATTACH DATABASE ? AS source', (db_file,))
+            except sqlite3.Error as e:
+                logging.error(f'{db_file} not merged: {e}')
+                continue
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    source_layout = layout_of(connection, 'source')
+                    if source_layout is None:
+                        logging.warning(f'{db_file} is empty, skipped')
+                    elif layout == 'wide':
+                        rows += _merge_wide(connection, columns)
+                    else:
+                        rows += _merge_normalized(connection, source_layout)
+                    connection.execute('COMMIT')
+                    merged += source_layout is not None
+                except sqlite3.Error as e:
+                    connection.execute('ROLLBACK')
+                    if layout == 'wide':
+                        columns = _sections(connection, 'main')
+                    logging.error(f'{db_file} not merged: {e}')
+            finally:
+                connection.execute('DETACH DATABASE source')
+
+        if layout == 'normalized':
+            nutrients = connection.execute('SELECT id, section, name FROM nutrients ORDER BY id').fetchall()
+            connection.execute('BEGIN IMMEDIATE')
+            for statement in section_views(nutrients):
+                connection.execute(statement)
+            connection.execute('COMMIT')
+    finally:
+        connection.close()
+
+    logging.info(f'Merged {merged} of {len(db_files)} runs ({rows} rows) into {output} in {perf_counter() - start:.2f} s')
+    return merged
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge the databases of many runs into one, the newest values winning.')
+    parser.add_argument('db_files', nargs='*', help=f'run databases (default: {SOURCES})')
+    parser.add_argument('--output', default=OUTPUT, help=f'master database (default: {OUTPUT})')
+    parser.add_argument('--layout', choices=('wide', 'normalized'), help='layout of a new master database (default: wide)')
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    merge(arguments.db_files or glob.glob(SOURCES), arguments.output, arguments.layout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import json
+import threading
+from time import perf_counter
+from contextlib import contextmanager
+
+class Metrics:
+    '''
+    Per-stage timings of a run (driver start, page load, table scrape, parse,
+    unit conversion, DB write, CSV write...), aggregated for the whole run
+    and, for the stages timed while extracting a URL, per URL.
+    Other measures, such as the memory of the browser, are observed the same way.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stages = {}
+        self.values = {}
+        self.urls = {}
+
+    @contextmanager
+    def url_context(self, url):
+        '''
+        Attribute the stages timed by this thread to a URL.
+        '''
+        previous = getattr(self._local, 'url', None)
+        self._local.url = url
+        try:
+            yield
+        finally:
+            self._local.url = previous
+
+    @contextmanager
+    def timer(self, stage):
+        '''
+        Time the body of the with statement as a stage.
+        '''
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, perf_counter() - start)
+
+    def record(self, stage, seconds):
+        url = getattr(self._local, 'url', None)
+        with self._lock:
+            self.stages.setdefault(stage, []).append(seconds)
+            if url is not None:
+                per_url = self.urls.setdefault(url, {})
+                per_url[stage] = per_url.get(stage, 0.0) + seconds
+
+    def observe(self, name, value):
+        '''
+        Record a measure that is not a duration, like the RSS of the browser in MB.
+        The last value observed while extracting a URL is kept for that URL.
+        '''
+        url = getattr(self._local, 'url', None)
+        with self._lock:
+            self.values.setdefault(name, []).append(value)
+            if url is not None:
+                self.urls.setdefault(url, {})[name] = value
+
+    def summary(self, values=False):
+        '''
+        Return {stage: {count, total, mean, p50, p90, p99, max}}, in seconds,
+        or the same for the observed measures if values is True.
+        '''
+        summary = {}
+        with self._lock:
+            stages = {stage: sorted(samples) for stage, samples in (self.values if values else self.stages).items()}
+        for stage, samples in stages.items():
+            pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+            total = sum(samples)
+            summary[stage] = {
+                'count': len(samples),
+                'total': total,
+                'mean': total / len(samples),
+                'p50': pick(0.5),
+                'p90': pick(0.9),
+                'p99': pick(0.99),
+                'max': samples[-1],
+            }
+        return summary
+
+    def write_json(self, path):
+        '''
+        Save the run summary and the per-URL timings as JSON.
+        '''
+        with self._lock:
+            urls = {url: dict(stages) for url, stages in self.urls.items()}
+        with open(path, 'w') as file:
+            json.dump({'stages': self.summary(), 'values': self.summary(values=True), 'urls': urls}, file, indent=2)
+
+    def write_prometheus(self, path, prefix='food_table_reader'):
+        '''
+        Save the run summary in the Prometheus textfile format.
+        '''
+        lines = [
+            f'# HELP {prefix}_stage_seconds Time spent in each stage of the run.',
+            f'# TYPE {prefix}_stage_seconds summary',
+        ]
+        for stage, values in self.summary().items():
+            for quantile in ('p50', 'p90', 'p99'):
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="0.{quantile[1:]}"}} {values[quantile]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {values["total"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {values["count"]}')
+        for name, values in self.summary(values=True).items():
+            lines.append(f'# TYPE {prefix}_{name} summary')
+            for quantile in ('p50', 'p90', 'p99'):
+                lines.append(f'{prefix}_{name}{{quantile="0.{quantile[1:]}"}} {values[quantile]:.6f}')
+            lines.append(f'{prefix}_{name}_sum {values["total"]:.6f}')
+            lines.append(f'{prefix}_{name}_count {values["count"]}')
+        with open(path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.values = {}
+            self.urls = {}
+
+# Shared by every module of the program
+METRICS = Metrics()
+timer = METRICS.timer
+url_context = METRICS.url_context
+observe = METRICS.observe
@@ -0,0 +1,89 @@
+import re
+import html
+
+# Section headers of the FDC nutrient table and the table where each section
+# is saved. A new FDC category only needs a new entry here
+SECTIONS = {
+    'Proximates:': 'proximates',
+    'Carbohydrates:': 'carbohydrates',
+    'Minerals:': 'minerals',
+    'Vitamins and Other Components:': 'vitamins',
+    'Lipids:': 'lipids',
+    'Amino acids:': 'amino_acids',
+    'Phytosterols:': 'phytosterols',
+    'Organic acids:': 'organic_acids',
+    'Isoflavones:': 'isoflavones',
+    'Oligosaccharides:': 'oligosaccharides',
+}
+
+# Sections whose rows with an empty cell are ignored instead of saved
+SKIP_INCOMPLETE_ROWS = {'vitamins'}
+
+def parse_rows(rows):
+    '''
+    Split the raw (name, amount, unit) rows of a nutrient table into sections.
+    Return the non-empty rows of the full table and a dictionary
+    table name -> nutrient rows, in the order of SECTIONS.
+    Rows before the first section header are kept only in the full table.
+    '''
+    table_rows = []
+    sections = {}
+    current = None
+    for row in rows:
+        cell_data = list(row[:3])
+        # If the number of cells is less than 3, pad with None
+        if len(cell_data) < 3:
+            cell_data.extend([None] * (3 - len(cell_data)))
+        if cell_data == [None, None, None] or cell_data == ['', '', '']:
+            continue
+        table_rows.append(cell_data)
+
+        section = SECTIONS.get(cell_data[0])
+        if section is not None:
+            current = section
+        elif current is not None:
+            if current in SKIP_INCOMPLETE_ROWS and '' in cell_data:
+                continue
+            sections.setdefault(current, []).append(cell_data)
+
+    ordered_sections = {table: sections[table] for table in SECTIONS.values() if table in sections}
+    return table_rows, ordered_sections
+
+# Regular expressions reading the parts of a nutrient table page
+DESCRIPTION_PATTERN = re.compile(r'<(\w+)[^>]*\bid\s*=\s*["\']?foodDetailsDescription\b[^>]*>(.*?)</\1\s*>', re.S | re.I)
+TABLE_PART_PATTERN = re.compile(r'<(thead|tbody)\b[^>]*>(.*?)</\1\s*>', re.S | re.I)
+ROW_PATTERN = re.compile(r'<tr\b[^>]*>(.*?)</tr\s*>', re.S | re.I)
+CELL_PATTERN = re.compile(r'<(td|th)\b[^>]*>(.*?)</\1\s*>', re.S | re.I)
+TAG_PATTERN = re.compile(r'<[^>]*>')
+
+def clean_text(fragment):
+    '''
+    Return the text of an HTML fragment the way innerText shows it.
+    '''
+    if '<' in fragment:
+        fragment = TAG_PATTERN.sub('', fragment)
+    if '&' in fragment:
+        fragment = html.unescape(fragment)
+    return ' '.join(fragment.split())
+
+def parse_table_html(page):
+    '''
+    Parse the HTML of a nutrient table without a browser, with a few regular
+    expression scans instead of a full HTML parser.
+    Return the food name, the first 3 headers and the first 3 cells of every
+    row, the same data scrape_table reads from a live page.
+    '''
+    description = DESCRIPTION_PATTERN.search(page)
+    food = clean_text(description.group(2)) if description else None
+
+    headers = []
+    rows = []
+    for part, content in TABLE_PART_PATTERN.findall(page):
+        if part.lower() == 'thead':
+            headers += [clean_text(cell) for tag, cell in CELL_PATTERN.findall(content) if tag.lower() == 'th']
+        else:
+            for row in ROW_PATTERN.findall(content):
+                cells = [cell for tag, cell in CELL_PATTERN.findall(row) if tag.lower() == 'td']
+                rows.append([clean_text(cell) for cell in cells[:3]])
+
+    return food, headers[:3], rows
@@ -0,0 +1,152 @@
+import os
+import glob
+import sqlite3
+import logging
+import threading
+from food_index import normalize_query
+from manifest import existing_foods
+
+def trigrams(query):
+    '''
+    Set of the trigrams of the words of a normalized query, every word padded
+    with two spaces before and one after, as PostgreSQL's pg_trgm does, so that
+    the word order does not matter and the start of a word weighs more.
+    '''
+    grams = set()
+    for word in query.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class SearchIndex:
+    '''
+    In-memory trigram index of the FDC food descriptions seen so far, with
+    their URL when it is known. A food name is scored against every
+    description sharing a trigram with it, with the Dice coefficient of
+    their trigram sets: 1.0 for the same words (in any order, singular or
+    plural, with any punctuation), about 0.9 for a typo in a short name.
+    '''
+    def __init__(self):
+        self.descriptions = []
+        self.urls = []
+        self._ids = {}
+        self._sizes = []
+        self._postings = {}
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.descriptions)
+
+    def add(self, description, url=None):
+        '''
+        Index a description, or record the URL of a description already indexed.
+        '''
+        query = normalize_query(description)
+        if not query:
+            return
+        with self._lock:
+            i = self._ids.get(query)
+            if i is not None:
+                if url is not None:
+                    self.urls[i] = url
+                return
+            i = len(self.descriptions)
+            self._ids[query] = i
+            self.descriptions.append(description)
+            self.urls.append(url)
+            grams = trigrams(query)
+            self._sizes.append(len(grams))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(i)
+            self._arrays = None
+
+    def _frozen(self):
+        '''
+        The postings and the trigram counts as NumPy arrays, built again on
+        the first search after descriptions were added.
+        '''
+        import numpy as np
+        if self._arrays is None:
+            postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in self._postings.items()}
+            self._arrays = postings, np.array(self._sizes, dtype=np.float64)
+        return self._arrays
+
+    def search(self, food, limit=5):
+        '''
+        Return up to limit [score, description, url] candidates for a food
+        name, the best first.
+        '''
+        import numpy as np
+        grams = trigrams(normalize_query(food))
+        with self._lock:
+            if not grams or not self.descriptions:
+                return []
+            postings, sizes = self._frozen()
+            ids = [postings[gram] for gram in grams if gram in postings]
+            if not ids:
+                return []
+            shared = np.bincount(np.concatenate(ids), minlength=len(sizes))
+            scores = 2 * shared / (len(grams) + sizes)
+            candidates = np.flatnonzero(shared)
+            if len(candidates) > limit:
+                candidates = candidates[np.argpartition(-scores[candidates], limit)[:limit]]
+            # The description indexed first wins a tie
+            best = sorted(candidates.tolist(), key=lambda i: (-scores[i], i))
+            return [[float(scores[i]), self.descriptions[i], self.urls[i]] for i in best]
+
+    def match(self, food, min_score):
+        '''
+        Return the best [score, description, url] candidate scoring at least
+        min_score among the descriptions with a URL, or None.
+        '''
+        for score, description, url in self.search(food):
+            if score < min_score:
+                return None
+            if url is not None:
+                return [score, description, url]
+        return None
+
+def build_search_index(results_directory='./results/', resolution_index=None, corrected_foods=''):
+    '''
+    Build a SearchIndex from what the previous runs collected: the searches
+    of the resolution index and the URLs of the run manifests, with their
+    URL, and the descriptions of the corrected_foods files and of the
+    databases of the results folder (runs and merged master).
+    '''
+    index = SearchIndex()
+    if resolution_index is not None:
+        for url, description in resolution_index.urls().items():
+            index.add(description, url)
+
+    for manifest_file in sorted(glob.glob(os.path.join(results_directory, '*', 'manifest_*.db'))):
+        try:
+            connection = sqlite3.connect(manifest_file)
+            try:
+                for url, description in connection.execute("SELECT key, food FROM items WHERE kind = 'url' AND food IS NOT NULL"):
+                    index.add(description, url)
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logging.warning(f'Manifest {manifest_file} not indexed: {e}')
+
+    corrected_files = sorted(glob.glob(os.path.join(results_directory, '*', 'corrected_foods_*.txt')))
+    if corrected_foods != '':
+        corrected_files.append(corrected_foods)
+    for corrected_file in corrected_files:
+        with open(corrected_file) as file:
+            for line in file:
+                index.add(line.strip())
+
+    db_files = glob.glob(os.path.join(results_directory, '*', 'food_components_*.db'))
+    db_files += glob.glob(os.path.join(results_directory, 'food_components_*.db'))
+    for db_file in sorted(db_files):
+        try:
+            for description in existing_foods(db_file):
+                index.add(description)
+        except sqlite3.Error as e:
+            logging.warning(f'Database {db_file} not indexed: {e}')
+
+    with_url = sum(url is not None for url in index.urls)
+    logging.info(f'Search index built: {len(index)} descriptions, {with_url} with a URL')
+    return index
@@ -0,0 +1,85 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import logging
+
+FDC_ID_PATTERN = re.compile(r'food-details/(\d+)')
+
+def fdc_id_from_url(url):
+    '''
+    Return the FDC id of a food-details URL, or None if there is none.
+    '''
+    match = FDC_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+class SnapshotStore:
+    '''
+    Content-addressed store of the rendered nutrient tables.
+    The gzipped HTML is saved once per content in objects/<hash>.html.gz and
+    refs/<fdc id>.json points every food to its latest snapshot.
+    '''
+    def __init__(self, root='snapshots'):
+        self.root = root
+        self.objects = os.path.join(root, 'objects')
+        self.refs = os.path.join(root, 'refs')
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.refs, exist_ok=True)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest + '.html.gz')
+
+    def save(self, url, html):
+        '''
+        Save the HTML of a food-details page and return its hash.
+        '''
+        fdc_id = fdc_id_from_url(url)
+        if fdc_id is None:
+            logging.warning(f'No FDC id in "{url}", snapshot not saved')
+            return None
+
+        data = html.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            temporary_path = f'{object_path}.{os.getpid()}.tmp'
+            with gzip.open(temporary_path, 'wb') as file:
+                file.write(data)
+            os.replace(temporary_path, object_path)
+
+        ref_path = os.path.join(self.refs, fdc_id + '.json')
+        temporary_path = f'{ref_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump({'fdc_id': fdc_id, 'url': url, 'sha256': digest}, file)
+        os.replace(temporary_path, ref_path)
+
+        return digest
+
+    def load(self, fdc_id):
+        '''
+        Return the latest HTML saved for an FDC id, or None.
+        '''
+        ref_path = os.path.join(self.refs, str(fdc_id) + '.json')
+        if not os.path.exists(ref_path):
+            return None
+        with open(ref_path) as file:
+            ref = json.load(file)
+        with gzip.open(self._object_path(ref['sha256']), 'rb') as file:
+            return file.read().decode('utf-8')
+
+    def snapshots(self):
+        '''
+        Yield (url, html) for every food in the store.
+        '''
+        for file_name in sorted(os.listdir(self.refs)):
+            if not file_name.endswith('.json'):
+                continue
+            with open(os.path.join(self.refs, file_name)) as file:
+                ref = json.load(file)
+            try:
+                with gzip.open(self._object_path(ref['sha256']), 'rb') as file:
+                    yield ref['url'], file.read().decode('utf-8')
+            except OSError as e:
+                logging.error(f'Snapshot of FDC id {ref["fdc_id"]} unreadable: {e}')
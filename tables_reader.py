@@ -1,487 +1,407 @@
-import os
+import json
 import logging
-from time import sleep
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.firefox.service import Service
-from webdriver_manager.firefox import GeckoDriverManager
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.microsoft import EdgeChromiumDriverManager
-from sqlalchemy import create_engine, MetaData, Table, Column, String, Float, exc, inspect, text, select, func
-from sqlalchemy.exc import SQLAlchemyError
-
-def convert_to_mg(data):
-    '''
-    Convert data to mg if necessary.
-    '''
-    processed_data = []
-    for mineral, value, unit in data:
-        if '<' in value:
-            numeric_value = float(value.replace('<', ''))
-            if unit == 'µg':
-                value_mg = numeric_value / 1000  # Convert µg to mg
-            elif unit == 'g':
-                value_mg = numeric_value * 1000  # Convert g to mg
-            else:
-                value_mg = numeric_value
-        else:
-            numeric_value = float(value)
-            if unit == 'µg':
-                value_mg = numeric_value / 1000  # Convert µg to mg
-            elif unit == 'g':
-                value_mg = numeric_value * 1000  # Convert g to mg
-            else:
-                value_mg = numeric_value
-        processed_data.append([mineral, value_mg])
-    
-    return processed_data
-
-def list_to_dict(data):
-    '''
-    Transform a list into a dictionary in order to convert it into a pandas DataFrame.
-    '''
-    food_dict = {}
-    for item in data:
-        key = item[0]
-        value = item[1]
-        food_dict[key] = value
-    return food_dict
-
-def get_record_count(connection, table):
-    '''
-    Get the count of records in a specified database table.
-    '''
-    count_stmt = select((func.count())).select_from(table)
-    result = connection.execute(count_stmt)
-    count = result.scalar()
-    return count
-
-def save_to_db(df, table_name, db_path='sqlite:///food_components.db'):
+import threading
+from time import sleep, time
+import drivers
+import metrics
+import nutrients
+import writers
+from snapshots import fdc_id_from_url
+
+# FoodData Central application, replaced by a local stand-in in the benchmarks
+FDC_APP_URL = 'https://fdc.nal.usda.gov/fdc-app.html'
+
+# pandas (with units) and Selenium take most of the start-up time, so they are
+# imported by the functions using them: the modes that need neither a browser
+# nor a DataFrame do not pay for them
+
+def save_to_db(df, table_name, db_path='sqlite:///food_components.db', check='rowcount'):
     '''
     Save a DataFrame into its specific table in food_components.db.
+    For many inserts keep a writers.SQLiteWriter open for the whole run instead.
     '''
-    logging.info('Starting save_to_db function')
-    engine = create_engine(db_path)
-    meta = MetaData()
-    inspector = inspect(engine)
-
-    # Define initial columns (assuming 'Food' as the primary key)
-    initial_columns = [Column('Food', String, primary_key=True)]
-    for col in df.columns:
-        if col != 'Food':
-            initial_columns.append(Column(col, Float))  # Use Float instead of String
-
-    logging.info('Initial columns for table')
-
-    with engine.connect() as connection:
-        # Check if the table exists
-        if not connection.dialect.has_table(connection, table_name):
-            # Define the table schema
-            table = Table(table_name, meta, *initial_columns, extend_existing=True)
-            # Create table in database if it doesn't exist
-            try:
-                meta.create_all(engine)
-                logging.info('Table created successfully')
-            except exc.SQLAlchemyError as e:
-                logging.error(f'Error creating table {table_name}: {e}')
-        else:
-            logging.info('Table already exists')
-            # Get existing columns
-            existing_columns = inspector.get_columns(table_name)
-            existing_column_names = [col['name'] for col in existing_columns]
-            logging.info('Existing columns')
-
-            # Find new columns to add
-            new_columns = []
-            for col in df.columns:
-                if col not in existing_column_names:
-                    new_columns.append(Column(col, Float))  # Ensure new columns are added as Float
-            
-            # Add new columns if any
-            if new_columns:
-                logging.info(f'New columns to add: {new_columns}')
-                for column in new_columns:
-                    alter_stmt = text(f'ALTER TABLE {table_name} ADD COLUMN "{column.name}" FLOAT')  # Use FLOAT for new columns
-                    try:
-                        connection.execute(alter_stmt)
-                        logging.info(f'Added column {column.name} of type {column.type} to table {table_name}')
-                    except exc.SQLAlchemyError as e:
-                        logging.error(f'Error adding column {column.name}: {e}')
-
-                # Update existing rows with default values for new columns
-                for column in new_columns:
-                    update_stmt = text(f'UPDATE {table_name} SET "{column.name}" = 0')  # Set default value to 0
-                    try:
-                        connection.execute(update_stmt)
-                        logging.info(f'Updated existing rows with default value for column {column.name}')
-                    except exc.SQLAlchemyError as e:
-                        logging.error(f'Error updating existing rows for column {column.name}: {e}')
-
-        # Insert or update the records
-        table = Table(table_name, meta, autoload_with=engine)
-
-    # Insert or update the record
-    with engine.connect() as connection:
-        transaction = connection.begin()
-        try:
-            # Count records before insertion
-            count_before = get_record_count(connection, table)
-            logging.info(f'Record count before insertion: \t{count_before}')
-
-            for _, row in df.iterrows():
-                data = row.to_dict()
-                # Convert all data to float (assuming all columns except 'Food' should be float)
-                data = {key: float(value) if key != 'Food' else value for key, value in data.items()}
-                logging.info(f'Data to insert: {data}')
-                stmt = table.insert().values(data).prefix_with('OR REPLACE')
-                logging.info('SQL Statement')
-                connection.execute(stmt)
-            transaction.commit()
-            logging.info(f'Data {data["Food"]} inserted successfully to "{table_name}"')
-
-            # Count records after insertion
-            count_after = get_record_count(connection, table)
-            logging.info(f'Record count after insertion: \t\t{count_after}')
-
-            if count_after == count_before:
-                raise SQLAlchemyError('Record count did not change after insertion')
-
-        except SQLAlchemyError as e:
-            transaction.rollback()
-            logging.error(f'Error inserting data "{table_name}": {e}')
-
+    writer = writers.SQLiteWriter(db_path, batch_size=len(df), check=check)
+    writer.add(df, table_name)
+    writer.close()
     logging.info(f'Completed save_to_db function of "{table_name}"')
 
 def save_to_csv(data, file_path):
     '''
     Save a DataFrame to food_components.csv.
+    For many rows keep a writers.CSVWriter open for the whole run instead.
     '''
-    if os.path.exists(file_path):
-        # If the file exists, read it into a DataFrame
-        existing_data = pd.read_csv(file_path)
-        # Append the new data, aligning columns and filling missing values with NaN
-        combined_data = pd.concat([existing_data, data], ignore_index=True)
-        # Save the combined DataFrame back to the CSV file
-        combined_data.to_csv(file_path, mode='w', header=True, index=False)
-    else:
-        # If the file does not exist, create it and write the header
-        data.to_csv(file_path, mode='w', header=True, index=False)
+    writer = writers.CSVWriter(file_path)
+    writer.add(data)
+    writer.close()
+
+# Collects the food name, the first 3 headers and the first 3 cells of every row
+SCRAPE_TABLE_SCRIPT = '''
+const text = el => (el.innerText || el.textContent || '').trim();
+const description = document.getElementById('foodDetailsDescription');
+if (!description) {
+    return null;
+}
+const headers = Array.from(document.querySelectorAll('thead th')).slice(0, 3).map(text);
+const rows = Array.from(document.querySelectorAll('tbody tr')).map(
+    row => Array.from(row.querySelectorAll('td')).slice(0, 3).map(text)
+);
+return [text(description), headers, rows];
+'''
+
+# Rendered HTML of the food name and of the nutrient table, for the snapshots
+SNAPSHOT_SCRIPT = '''
+const description = document.getElementById('foodDetailsDescription');
+const head = document.querySelector('thead');
+const table = head ? head.closest('table') : null;
+return description && table ? description.outerHTML + '\\n' + table.outerHTML : null;
+'''
+
+def scrape_table_by_rows(driver):
+    '''
+    Read the food name, the headers and the rows element by element.
+    Slow (one WebDriver call per cell) but independent from JavaScript.
+    '''
+    from selenium.webdriver.common.by import By
+    food = driver.find_element(By.ID, 'foodDetailsDescription').text
+
+    # Extract the headers (only first 3 headers)
+    headers = driver.find_elements(By.XPATH, '//thead//th')
+    header_list = [header.text.strip() for header in headers[:3]]
+
+    rows = []
+    for row in driver.find_elements(By.XPATH, '//tbody//tr'):
+        cells = row.find_elements(By.XPATH, './/td')
+        rows.append([cell.text.strip() for cell in cells[:3]])  # Only take the first 3 cells
+
+    return food, header_list, rows
+
+def scrape_table(driver):
+    '''
+    Read the food name, the headers and the rows of the nutrient table
+    with a single script execution, falling back to the per-row path.
+    '''
+    try:
+        result = driver.execute_script(SCRAPE_TABLE_SCRIPT)
+        if result:
+            food, header_list, rows = result
+            return food, list(header_list), [list(row) for row in rows]
+        logging.warning('Bulk scraping found no table, using the per-row path')
+    except Exception as e:
+        logging.warning(f'Bulk scraping failed, using the per-row path: {e}')
+
+    return scrape_table_by_rows(driver)
+
+def save_section(df, table_name, folder_name):
+    '''
+    Save the DataFrame of a section into the .db and .csv files of the run.
+    '''
+    save_to_db(df, table_name, 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db')
+    save_to_csv(df, folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv')
 
-def extract_table_data(driver, url, folder_name):
+def save_amounts(amounts, folder_name):
+    '''
+    Turn the amounts of a page into section DataFrames and save each one
+    into the .db and .csv files of the run.
+    For many pages hand the amounts to a writers.ResultWriter instead.
     '''
-    Extract the data from the tables using Selenium and organize them into 
-    specific DataFrames in order to create .csv and .db files.
+    import units
+    for table_name, df in units.to_sections(units.normalize(units.amounts_to_long(amounts))).items():
+        save_section(df, table_name, folder_name)
+
+def process_table(food, header_list, rows, save):
     '''
+    Split the rows of a nutrient table into sections and hand the list of
+    units.Amount of the page to save(amounts); the ResultWriter converts
+    the units of a whole batch of pages at once.
+    Return the full table as a list of rows, the headers first.
+    '''
+    import units
+    with metrics.timer('parse'):
+        full_table_data, sections = nutrients.parse_rows(rows)
+        amounts = units.page_amounts(sections, food)
+    save(amounts)
+
+    return [header_list] + full_table_data
+
+def page_cache_key(url):
+    '''
+    Key of a food-details page in the fetch cache: its FDC id, or the URL.
+    '''
+    return 'page:' + (fdc_id_from_url(url) or url)
+
+def extract_table_from_cache(url, folder_name, save=None, cache=None):
+    '''
+    Like extract_table_data, but reading the page from the fetch cache.
+    Return None if the page is not in the cache.
+    '''
+    html = cache.get(page_cache_key(url))
+    if html is None:
+        return None
+    if save is None:
+        save = lambda amounts: save_amounts(amounts, folder_name)
+
+    with metrics.timer('html_parse'):
+        food, header_list, rows = nutrients.parse_table_html(html)
+    table = process_table(food, header_list, rows, save)
+    logging.info(f'Completed Extraction of "{food}" from the cache')
+    return table, food + '.csv'
+
+def extract_table_data(driver, url, folder_name, save=None, snapshots=None, cache=None):
+    '''
+    Extract the data from the tables using Selenium and convert them in
+    order to create .csv and .db files.
+    The amounts of the page are handed to save(amounts), by default written
+    straight to the files of the run. Return the full table as a list of
+    rows (empty on error) and the name of its .csv file. With a snapshots.SnapshotStore or a
+    fetch_cache.FetchCache the rendered table is also saved there, to be
+    parsed again later without a browser.
+    '''
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    if save is None:
+        save = lambda amounts: save_amounts(amounts, folder_name)
+
+    food = url
     try:
-        # Navigate to the URL
-        driver.get(url)
-
-        # Wait for the table header to be present
-        wait = WebDriverWait(driver, 10)
-        wait.until(EC.presence_of_element_located((By.XPATH, '//thead//th')))
-
-        # Path of the file
-        food = driver.find_element(By.ID, 'foodDetailsDescription').text
-
-        # Locate the table header
-        headers = driver.find_elements(By.XPATH, '//thead//th')
-
-        # Extract the headers (only first 3 headers)
-        header_list = [header.text.strip() for header in headers[:3]]
-
-        # Locate the table rows
-        rows = driver.find_elements(By.XPATH, '//tbody//tr')
-
-        proximates = []
-        carbohydrates = []
-        minerals = []
-        vitamins = []
-        lipids = []
-        amino_acids = []
-        phytosterols = []
-        organic_acids = []
-        isoflavones = []
-        oligosaccharides = []
-        
-        # Extract the data from the rows
-        table_data = []
-        full_table_data = []
-        for row in rows:
-            cells = row.find_elements(By.XPATH, './/td')
-            cell_data = [cell.text.strip() for cell in cells[:3]]  # Only take the first 3 cells
-            'https://fdc.nal.usda.gov/fdc-app.html#/food-details/2262074/nutrients'
-            # If the number of cells is less than 3, pad with None
-            if len(cell_data) < 3:
-                cell_data.extend([None] * (3 - len(cell_data)))
-            if cell_data != [None, None, None] and cell_data != ['','','']:
-                full_table_data.append(cell_data)
-                table_data.append(cell_data)
-                match table_data[0][0]:
-                    case 'Proximates:':
-                        if cell_data[0] not in ['Proximates:', 'Carbohydrates:', 'Minerals:', 'Vitamins and Other Components:', 'Lipids:', 'Amino acids:', 'Phytosterols:', 'Organic acids:', 'Isoflavones:', 'Oligosaccharides:']:
-                            proximates.append(cell_data)
-                        else:
-                            table_data = []
-                            table_data.append(cell_data)
-                    case 'Carbohydrates:':
-                        if cell_data[0] not in ['Proximates:', 'Carbohydrates:', 'Minerals:', 'Vitamins and Other Components:', 'Lipids:', 'Amino acids:', 'Phytosterols:', 'Organic acids:', 'Isoflavones:', 'Oligosaccharides:']:
-                            carbohydrates.append(cell_data)
-                        else:
-                            table_data = []
-                            table_data.append(cell_data)
-                    case 'Minerals:':
-                        if cell_data[0] not in ['Proximates:', 'Carbohydrates:', 'Minerals:', 'Vitamins and Other Components:', 'Lipids:', 'Amino acids:', 'Phytosterols:', 'Organic acids:', 'Isoflavones:', 'Oligosaccharides:']:
-                            minerals.append(cell_data)
-                        else:
-                            table_data = []
-                            table_data.append(cell_data)
-                    case 'Vitamins and Other Components:':
-                        if cell_data[0] not in ['Proximates:', 'Carbohydrates:', 'Minerals:', 'Vitamins and Other Components:', 'Lipids:', 'Amino acids:', 'Phytosterols:', 'Organic acids:', 'Isoflavones:', 'Oligosaccharides:']:
-                            if '' in cell_data:
-                                continue
-                            vitamins.append(cell_data)
-                        else:
-                            table_data = []
-                            table_data.append(cell_data)
-                    case 'Lipids:':
-                        if cell_data[0] not in ['Proximates:', 'Carbohydrates:', 'Minerals:', 'Vitamins and Other Components:', 'Lipids:', 'Amino acids:', 'Phytosterols:', 'Organic acids:', 'Isoflavones:', 'Oligosaccharides:']:
-                            lipids.append(cell_data)
-                        else:
-                            table_data = []
-                            table_data.append(cell_data)
-                    case 'Amino acids:':
-                        if cell_data[0] not in ['Proximates:', 'Carbohydrates:', 'Minerals:', 'Vitamins and Other Components:', 'Lipids:', 'Amino acids:', 'Phytosterols:', 'Organic acids:', 'Isoflavones:', 'Oligosaccharides:']:
-                            amino_acids.append(cell_data)
-                        else:
-                            table_data = []
-                            table_data.append(cell_data)
-                    case 'Phytosterols:':
-                        if cell_data[0] not in ['Proximates:', 'Carbohydrates:', 'Minerals:', 'Vitamins and Other Components:', 'Lipids:', 'Amino acids:', 'Phytosterols:', 'Organic acids:', 'Isoflavones:', 'Oligosaccharides:']:
-                            phytosterols.append(cell_data)
-                        else:
-                            table_data = []
-                            table_data.append(cell_data)
-                    case 'Organic acids:':
-                        if cell_data[0] not in ['Proximates:', 'Carbohydrates:', 'Minerals:', 'Vitamins and Other Components:', 'Lipids:', 'Amino acids:', 'Phytosterols:', 'Organic acids:', 'Isoflavones:', 'Oligosaccharides:']:
-                            organic_acids.append(cell_data)
-                        else:
-                            table_data = []
-                            table_data.append(cell_data)
-                    case 'Isoflavones:':
-                        if cell_data[0] not in ['Proximates:', 'Carbohydrates:', 'Minerals:', 'Vitamins and Other Components:', 'Lipids:', 'Amino acids:', 'Phytosterols:', 'Organic acids:', 'Isoflavones:', 'Oligosaccharides:']:
-                            isoflavones.append(cell_data)
-                        else:
-                            table_data = []
-                            table_data.append(cell_data)
-                    case 'Oligosaccharides:':
-                        if cell_data[0] not in ['Proximates:', 'Carbohydrates:', 'Minerals:', 'Vitamins and Other Components:', 'Lipids:', 'Amino acids:', 'Phytosterols:', 'Organic acids:', 'Isoflavones:', 'Oligosaccharides:']:
-                            oligosaccharides.append(cell_data)
-                        else:
-                            table_data = []
-                            table_data.append(cell_data)                     
-
-        if proximates:
-            proximates = convert_to_mg(proximates)
-            proximates.insert(0, ['Food', food])
-            proximates_dict = list_to_dict(proximates)
-            dfproximates = pd.DataFrame([proximates_dict])
-            save_to_db(dfproximates, 'proximates', 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db')
-            save_to_csv(dfproximates, folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv')
-
-        if carbohydrates:
-            carbohydrates = convert_to_mg(carbohydrates)
-            carbohydrates.insert(0, ['Food', food])
-            carbohydrates = list_to_dict(carbohydrates)
-            dfcarbohydrates = pd.DataFrame([carbohydrates])
-            save_to_db(dfcarbohydrates, 'carbohydrates', 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db')
-            save_to_csv(dfcarbohydrates, folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv')
-
-        if minerals:
-            minerals = convert_to_mg(minerals)
-            minerals.insert(0, ['Food', food])
-            minerals = list_to_dict(minerals)
-            dfminerals = pd.DataFrame([minerals])
-            save_to_db(dfminerals, 'minerals', 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db')
-            save_to_csv(dfminerals, folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv')
-
-        if vitamins:
-            vitamins = convert_to_mg(vitamins)
-            vitamins.insert(0, ['Food', food])
-            vitamins = list_to_dict(vitamins)
-            dfvitamins = pd.DataFrame([vitamins])
-            save_to_db(dfvitamins, 'vitamins', 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db')
-            save_to_csv(dfvitamins, folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv')
-
-        if lipids:
-            lipids = convert_to_mg(lipids)
-            lipids.insert(0, ['Food', food])
-            lipids = list_to_dict(lipids)
-            dflipids = pd.DataFrame([lipids])
-            save_to_db(dflipids, 'lipids', 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db')
-            save_to_csv(dflipids, folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv')
-
-        if amino_acids:
-            amino_acids = convert_to_mg(amino_acids)
-            amino_acids.insert(0, ['Food', food])
-            amino_acids = list_to_dict(amino_acids)
-            dfamino_acids = pd.DataFrame([amino_acids])
-            save_to_db(dfamino_acids, 'amino_acids', 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db')
-            save_to_csv(dfamino_acids, folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv')
-
-        if phytosterols:
-            phytosterols = convert_to_mg(phytosterols)
-            phytosterols.insert(0, ['Food', food])
-            phytosterols = list_to_dict(phytosterols)
-            dfphytosterols = pd.DataFrame([phytosterols])
-            save_to_db(dfphytosterols, 'phytosterols', 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db')
-            save_to_csv(dfphytosterols, folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv')
-
-        if organic_acids:
-            organic_acids = convert_to_mg(organic_acids)
-            organic_acids.insert(0, ['Food', food])
-            organic_acids = list_to_dict(organic_acids)
-            dforganic_acids = pd.DataFrame([organic_acids])
-            save_to_db(dforganic_acids, 'organic_acids', 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db')
-            save_to_csv(dforganic_acids, folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv')
-
-        if isoflavones:
-            isoflavones = convert_to_mg(isoflavones)
-            isoflavones.insert(0, ['Food', food])
-            isoflavones = list_to_dict(isoflavones)
-            dfisoflavones = pd.DataFrame([isoflavones])
-            save_to_db(dfisoflavones, 'isoflavones', 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db')
-            save_to_csv(dfisoflavones, folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv')
-
-        if oligosaccharides:
-            oligosaccharides = convert_to_mg(oligosaccharides)
-            oligosaccharides.insert(0, ['Food', food])
-            oligosaccharides = list_to_dict(oligosaccharides)
-            dfoligosaccharides = pd.DataFrame([oligosaccharides])
-            save_to_db(dfoligosaccharides, 'oligosaccharides', 'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db')
-            save_to_csv(dfoligosaccharides, folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv')
-
-        df = pd.DataFrame(full_table_data, columns=header_list)
+        with metrics.timer('page_load'):
+            # Navigate to the URL
+            driver.get(url)
+
+            # Wait for the table header to be present
+            wait = WebDriverWait(driver, 10)
+            wait.until(EC.presence_of_element_located((By.XPATH, '//thead//th')))
+        rss = drivers.browser_rss(driver)
+        if rss is not None:
+            metrics.observe('browser_rss_mb', rss)
+
+        # Food name, headers and rows in a single round trip
+        with metrics.timer('table_scrape'):
+            food, header_list, rows = scrape_table(driver)
+
+        if snapshots is not None or cache is not None:
+            try:
+                with metrics.timer('snapshot'):
+                    html = driver.execute_script(SNAPSHOT_SCRIPT)
+                if html and snapshots is not None:
+                    snapshots.save(url, html)
+                if html and cache is not None:
+                    cache.put(page_cache_key(url), html)
+            except Exception as e:
+                logging.error(f'Snapshot of "{food}" not saved: {e}')
+
+        # Split the rows into their sections and save them
+        table = process_table(food, header_list, rows, save)
         logging.info('Completed Extraction')
 
     except Exception as e:
         logging.error(f'An error occurred with "{food}": {e}')
-        df = pd.DataFrame()  # Return an empty DataFrame on error
+        table = []  # Return an empty table on error
 
-    return df, food + '.csv'
+    return table, food + '.csv'
 
-def search_food(driver, food, folder_name):
+def search_url(food):
+    '''
+    Return the URL of the FDC search page of a food.
+    '''
+    return FDC_APP_URL + '#/food-search?type=Foundation&query=' + food
+
+def write_search_results(food, results, folder_name):
+    '''
+    Write the [description, url] pairs found for a food into the
+    missing_foods, corrected_foods and urls files.
+    '''
+    if results == []:
+        with open(folder_name + '/missing_foods_' + folder_name.split('/')[-1] + '.txt', 'a') as file:
+            file.write(f'{food}\n')
+        return
+
+    with open(folder_name + '/corrected_foods_' + folder_name.split('/')[-1] + '.txt', 'a') as file:
+        for description, href_value in results:
+            file.write(f'{description}\n')
+    with open(folder_name + '/urls_' + folder_name.split('/')[-1] + '.txt', 'a') as file:
+        for description, href_value in results:
+            if href_value is not None:
+                file.write(f'{href_value}\n')
+
+def search_food_from_cache(food, folder_name, cache):
+    '''
+    Write the search results of a food from the fetch cache.
+    Return the [description, url] results, or None if the food is not in the cache.
+    '''
+    cached = cache.get('search:' + search_url(food))
+    if cached is None:
+        return None
+    results = json.loads(cached)
+    write_search_results(food, results, folder_name)
+    logging.info(f'Search results of "{food}" read from the cache')
+    return results
+
+# XPath of the rows of the search results and of the message shown when there are none
+SEARCH_ROWS_XPATH = '//tbody[@_ngcontent-c3]/tr'
+NO_RESULTS_XPATH = "//*[contains(text(), 'No results') or contains(text(), 'no results')]"
+
+class CircuitBreaker:
+    '''
+    Stop sending searches after max_failures consecutive failed ones, so that
+    the site is not hammered while it is down: the searches wait (see wait)
+    until cooldown seconds have passed, then one is let through again to
+    probe the site.
+    '''
+    def __init__(self, max_failures=5, cooldown=60):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        '''
+        Return True if a request can be sent.
+        '''
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            return time() - self.opened_at >= self.cooldown
+
+    def wait(self):
+        '''
+        Block until a request can be sent.
+        '''
+        with self._lock:
+            remaining = 0 if self.opened_at is None else self.opened_at + self.cooldown - time()
+        if remaining > 0:
+            sleep(remaining)
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logging.info('Circuit breaker closed, the site answers again')
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                if self.opened_at is None:
+                    logging.error(f'Circuit breaker opened after {self.failures} consecutive failures')
+                self.opened_at = time()
+
+def search_results_ready(driver):
+    '''
+    Wait condition: the result rows, or the message saying there are none.
+    Return ('results', rows) or ('none', []), or False while the page is
+    loading: WebDriverWait.until keeps waiting on any falsy value, so the
+    empty list of the no-results page has to be wrapped.
+    '''
+    from selenium.webdriver.common.by import By
+    rows = driver.find_elements(By.XPATH, SEARCH_ROWS_XPATH)
+    if rows:
+        return ('results', rows)
+    if driver.find_elements(By.XPATH, NO_RESULTS_XPATH):
+        return ('none', [])
+    return False
+
+def search_food(driver, food, folder_name, cache=None, breaker=None, max_attempts=4, timeout=15, backoff=1):
     '''
     Search for foods using Selenium and output 3 files:
     - missing_foods: for foods that couldn't be found
     - corrected_foods: using the names found on the site
     - urls: containing the links of all the foods found
+    The results are also saved in the fetch cache, if any.
+    A failed search is retried up to max_attempts times, waiting backoff
+    seconds and then twice as long each time; a circuit breaker shared by
+    the run makes it wait while the site keeps failing. A page showing
+    neither results nor the no-results message within timeout seconds is
+    a failed attempt.
+    Return the [description, url] results, or None if the search failed.
     '''
-    success = False
-    while success == False:
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
+    url = search_url(food)
+    for attempt in range(max_attempts):
+        if breaker is not None and not breaker.allow():
+            # Waiting keeps the rest of the foods for when the site answers again
+            logging.warning(f'Search of "{food}" waits {breaker.cooldown} s, too many errors from the site')
+            breaker.wait()
         try:
-            sleep(1)
             logging.info(food)
-            url = 'https://fdc.nal.usda.gov/fdc-app.html#/food-search?type=Foundation&query=' + food
-            driver.get(url)
-            driver.refresh()
-
-            sleep(1)
-            # Locate the rows in the table body
-            rows = driver.find_elements(By.XPATH, '//tbody[@_ngcontent-c3]/tr')
+            with metrics.timer('search_page_load'):
+                # A blank page first, so the rows of the previous search cannot be mistaken for the new ones
+                driver.get('about:blank')
+                driver.get(url)
+
+                # Wait for the results table, or for the message saying there are none.
+                # Only that message means no results: a slow page is retried and counts for the breaker
+                try:
+                    page, rows = WebDriverWait(driver, timeout).until(search_results_ready)
+                except TimeoutException:
+                    raise TimeoutException(f'no results table nor "No results" message after {timeout} seconds') from None
 
             descriptions = []
-
-            if rows == []:
-                with open(folder_name + '/missing_foods_' + folder_name.split('/')[-1] + '.txt', 'a') as file:
-                    file.write(f'{food}\n')
-            else:
-                # Open the file in write mode
-                with open(folder_name + '/corrected_foods_' + folder_name.split('/')[-1] + '.txt', 'a') as file:
-                    # Iterate over each row, check if the description contains 'almond', and write the first column (NDB Number) to the file
-                    for row in rows:
-                        description = row.find_element(By.XPATH, 'td[2]').text  # Locate the description column
-                        # if food in description.lower():  # Check if 'almond' is in the description
-                        #     ndb_number = row.find_element(By.XPATH, 'td[1]').text  # Locate the NDB Number column
-                        file.write(f'{description}\n')
-                        descriptions.append(description)
+            for row in rows:
+                description = row.find_element(By.XPATH, 'td[2]').text  # Locate the description column
+                descriptions.append(description)
                 logging.info(description)
-                # Find the element by class name and name attribute
-                for description in descriptions:
-                    try:
-                        link_element = driver.find_element(By.LINK_TEXT, description)
-                        
-                        # Once the element is present, get the href attribute
-                        href_value = link_element.get_attribute('href')
-                        with open(folder_name + '/urls_' + folder_name.split('/')[-1] + '.txt', 'a') as file:
-                            file.write(f'{href_value}\n')
-
-                        logging.info(href_value)
-                    except Exception as e:
-                        logging.error(f'An error occurred with "{food}": {e}')
-
-            success = True
-            sleep(1)
-        except Exception as e:
-            logging.error(f'error in the driver while connecting to the URL of "{food}": {e}')
 
-def set_up_driver():
-    '''
-    Set up the Driver.
-    '''
-    try:
-        # Set up the Firefox WebDriver 
-        driver_path = GeckoDriverManager().install()
-        service = Service(executable_path=driver_path)
-        # service = Service(executable_path='geckodriver') # for me has to be in the root
-        options = webdriver.FirefoxOptions()
-        options.add_argument('--headless')  # Run in headless mode (no GUI)
-        driver = webdriver.Firefox(service=service, options=options)
-
-    except Exception as e:
-        logging.error(f'Firefox driver not found: {e}')
-        try:
-            # Set up the Chrome WebDriver 
-            service = Service(ChromeDriverManager().install())
-            # driver_path = os.path.join(os.getcwd(), 'drivers', 'chromedriver')
-            # service = Service(executable_path=driver_path)
-            options = webdriver.ChromeOptions()
-            options.add_argument('--headless')  # Run in headless mode (no GUI)
-            driver = webdriver.Chrome(service=service, options=options)
+            results = []
+            # Find the element by class name and name attribute
+            for description in descriptions:
+                try:
+                    link_element = driver.find_element(By.LINK_TEXT, description)
+
+                    # Once the element is present, get the href attribute
+                    href_value = link_element.get_attribute('href')
+                    logging.info(href_value)
+                except Exception as e:
+                    href_value = None
+                    logging.error(f'An error occurred with "{food}": {e}')
+                results.append([description, href_value])
+
+            write_search_results(food, results, folder_name)
+            if cache is not None:
+                cache.put('search:' + url, json.dumps(results))
+            if breaker is not None:
+                breaker.record_success()
+            return results
 
         except Exception as e:
-            logging.error(f'Chrome driver not found: {e}')
-            try:
-                # Set up the Edge WebDriver 
-                service = Service(EdgeChromiumDriverManager().install())
-               # driver_path = os.path.join(os.getcwd(), 'drivers', 'msedgedriver')
-                options = webdriver.EdgeOptions()
-                options.add_argument('--headless')  # Run in headless mode (no GUI)
-                driver = webdriver.Edge(service=service, options=options)
+            logging.error(f'error in the driver while connecting to the URL of "{food}" (attempt {attempt + 1}/{max_attempts}): {e}')
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt + 1 < max_attempts:
+                sleep(backoff * 2 ** attempt)
 
-            except Exception as e:
-                logging.error(f'Edge driver not found: {e}')
-                logging.error(f'Program ended because the WebDriver could not be found.')
-                return '',''
-            
-    finally:
-        driver.quit()
+    logging.error(f'Search of "{food}" failed after {max_attempts} attempts')
+    return None
+
+def set_up_driver(cache_path='driver_cache.json', offline=False, lean=False, memory_mb=1024, exclude=()):
+    '''
+    Set up the Driver, see drivers.resolve: the driver found is cached in
+    cache_path and, when offline, only a locally installed driver is used.
+    With lean the browser uses the lean profile of drivers.service_and_options.
+    The browsers in exclude are not used. No browser is started here.
+    '''
+    resolved = drivers.resolve(cache_path, offline, exclude=exclude)
+    if resolved is None:
+        logging.error(f'Program ended because the WebDriver could not be found.')
+        return '',''
 
-    return service, options
+    return drivers.service_and_options(*resolved, lean=lean, memory_mb=memory_mb)
 
 def initialize_driver(service, options):
     '''
-    Initialize the WebDriver.
+    Initialize the WebDriver of the browser the options are made for.
     '''
-    try:
+    from selenium import webdriver
+    browser = drivers.browser_of(options)
+    if browser == 'firefox':
         driver = webdriver.Firefox(service=service, options=options)
-    except:
-        try:
-            driver = webdriver.Chrome(service=service, options=options)
-        except:
-            driver = webdriver.Edge(service=service, options=options)
+    elif browser == 'edge':
+        driver = webdriver.Edge(service=service, options=options)
+    else:
+        driver = webdriver.Chrome(service=service, options=options)
 
     return driver
@@ -0,0 +1,129 @@
+import logging
+import numpy as np
+import pandas as pd
+
+# Unit of the FDC tables -> (unit it is stored in, conversion factor)
+UNITS = {
+    'g': ('mg', 1000.0),
+    'mg': ('mg', 1.0),
+    'µg': ('mg', 0.001),
+    'μg': ('mg', 0.001),
+    'ug': ('mg', 0.001),
+    'mcg': ('mg', 0.001),
+    'ng': ('mg', 0.000001),
+    'kcal': ('kcal', 1.0),
+    'kJ': ('kcal', 1 / 4.184),
+    'IU': ('IU', 1.0),
+}
+
+# International Units only convert to mg for a given nutrient
+IU_TO_MG = {
+    'Vitamin A, IU': 0.0003,
+    'Vitamin D (D2 + D3), International Units': 0.000025,
+}
+
+LONG_COLUMNS = ['Nutrient', 'Amount', 'Unit']
+
+# Unknown units already reported by normalize, to warn only once per run
+_unknown_units = set()
+
+class Amount:
+    '''
+    One raw amount of a food page, as read from its table and kept in the
+    extraction hot path until a batch of pages is normalized at once.
+    '''
+    __slots__ = ('food', 'section', 'nutrient', 'amount', 'unit')
+
+    def __init__(self, food, section, nutrient, amount, unit):
+        self.food = food
+        self.section = section
+        self.nutrient = nutrient
+        self.amount = amount
+        self.unit = unit
+
+def page_amounts(sections, food):
+    '''
+    Turn the sections returned by nutrients.parse_rows into a list of Amount,
+    without any DataFrame and without converting them yet.
+    '''
+    return [
+        Amount(food, table_name, nutrient, amount, unit)
+        for table_name, rows in sections.items() for nutrient, amount, unit in rows
+        ]
+
+def amounts_to_long(amounts):
+    '''
+    Build the long DataFrame (Food, Section, Nutrient, Amount, Unit) of a
+    batch of Amount, ready for normalize.
+    '''
+    return pd.DataFrame({
+        'Food': [amount.food for amount in amounts],
+        'Section': [amount.section for amount in amounts],
+        'Nutrient': [amount.nutrient for amount in amounts],
+        'Amount': [amount.amount for amount in amounts],
+        'Unit': [amount.unit for amount in amounts],
+    })
+
+def normalize(df):
+    '''
+    Convert a long DataFrame with Nutrient, Amount and Unit columns (and any
+    other column, such as Food or Section) to the units of UNITS, all rows at once.
+    Add the columns Value, ValueUnit and BelowDetection, the latter True for
+    the amounts reported as below the detection limit ('<0.1').
+    Amounts that are not numbers become NaN; unknown units are kept as they are.
+    '''
+    # Amounts and units repeat a lot: parse each distinct string once and
+    # broadcast the results with the factorized codes
+    codes, amounts = pd.factorize(df['Amount'])
+    stripped = pd.Series(amounts, dtype='string').str.strip()
+    below_detection = stripped.str.startswith('<').fillna(False).to_numpy(bool)
+    parsed = pd.to_numeric(stripped.str.lstrip('<'), errors='coerce').to_numpy(float)
+    # Missing amounts have code -1, which must read NaN and not the last value
+    below_detection = np.append(below_detection, False)[codes]
+    value = np.append(parsed, np.nan)[codes]
+
+    unit_codes, unit_names = pd.factorize(df['Unit'])
+    unit_names = [str(unit).strip() for unit in unit_names]
+    factor = np.array([UNITS.get(unit, (unit, np.nan))[1] for unit in unit_names] + [np.nan])[unit_codes]
+    target = np.array([UNITS.get(unit, (unit, None))[0] for unit in unit_names] + [None], dtype=object)[unit_codes]
+
+    unknown = sorted(unit for unit in unit_names if unit not in UNITS and unit != '' and unit not in _unknown_units)
+    if unknown:
+        _unknown_units.update(unknown)
+        logging.warning(f'Unknown units kept unconverted: {unknown}')
+
+    # International Units are converted only for the nutrients of IU_TO_MG
+    iu_factor = df['Nutrient'].map(IU_TO_MG).to_numpy(float)
+    convertible_iu = (target == 'IU') & ~np.isnan(iu_factor)
+    factor = np.where(convertible_iu, iu_factor, factor)
+    target = np.where(convertible_iu, 'mg', target)
+
+    result = df.copy()
+    result['Value'] = value * np.where(np.isnan(factor), 1.0, factor)
+    result['ValueUnit'] = target
+    result['BelowDetection'] = below_detection
+    return result
+
+def to_sections(df):
+    '''
+    Turn a normalized long DataFrame (Food, Section, Nutrient, Value) into
+    one wide DataFrame per section, one row per food, as saved in the
+    .db and .csv files. When a nutrient is repeated the last value wins.
+    The unit of every nutrient column is kept in the attrs of its DataFrame,
+    as attrs['units'] = {nutrient: unit}, together with the amounts below
+    the detection limit, as attrs['below_detection'] = [(food, nutrient)].
+    '''
+    frames = {}
+    df = df.drop_duplicates(['Food', 'Section', 'Nutrient'], keep='last')
+    for table_name, section in df.groupby('Section', sort=False):
+        wide = section.pivot(index='Food', columns='Nutrient', values='Value')
+        # Keep the nutrients in the order of the page and the foods in order of arrival
+        wide = wide.reindex(index=section['Food'].unique(), columns=section['Nutrient'].unique())
+        wide.columns.name = None
+        frames[table_name] = wide.reset_index()
+        if 'ValueUnit' in section:
+            frames[table_name].attrs['units'] = dict(zip(section['Nutrient'], section['ValueUnit']))
+        if 'BelowDetection' in section:
+            below = section[section['BelowDetection'].to_numpy(bool)]
+            frames[table_name].attrs['below_detection'] = list(zip(below['Food'], below['Nutrient']))
+    return frames
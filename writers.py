@@ -0,0 +1,603 @@
+import os
+import csv
+import logging
+import math
+import queue
+import threading
+import metrics
+
+# Pragmas suited to bulk loads: WAL lets readers work during the run and
+# synchronous=NORMAL only syncs at checkpoints instead of on every commit
+BULK_LOAD_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-64000',
+]
+
+# Unit every nutrient column of the section tables is stored in (mg, kcal...)
+UNITS_TABLE = 'nutrient_units'
+UNITS_SCHEMA = (
+    f'CREATE TABLE IF NOT EXISTS "{UNITS_TABLE}" '
+    '("Section" TEXT, "Nutrient" TEXT, "Unit" TEXT, PRIMARY KEY ("Section", "Nutrient"))'
+    )
+
+class SQLiteWriter:
+    '''
+    Long-lived writer for food_components.db: one engine and one connection
+    for the whole run, table schemas cached in memory and rows buffered and
+    inserted with executemany, one transaction per batch.
+    SQLAlchemy is only imported when the first batch is written.
+    check can be 'rowcount' (cheap, default), 'count' (COUNT(*) before and
+    after every batch, as the old save_to_db did) or None.
+    '''
+    def __init__(self, db_path='sqlite:///food_components.db', batch_size=200, check='rowcount'):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.check = check
+        self.inserted = 0
+        self.engine = None
+        self.connection = None
+        self._columns = {}
+        self._buffer = {}
+        self._pending = 0
+        self._units = {}
+        # Foods with rows dropped by a failed flush, until the caller resets it
+        self.dropped = set()
+
+    def _connect(self):
+        '''
+        Open the connection lazily, so it belongs to the thread that writes.
+        '''
+        from sqlalchemy import create_engine, event
+        self.engine = create_engine(self.db_path)
+
+        @event.listens_for(self.engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in BULK_LOAD_PRAGMAS:
+                cursor.execute(pragma)
+            cursor.close()
+
+        self.connection = self.engine.connect()
+
+    def add(self, df, table_name):
+        '''
+        Buffer the rows of a DataFrame, flushing when the batch is full.
+        '''
+        rows = self._buffer.setdefault(table_name, [])
+        verbose = logging.getLogger().isEnabledFor(logging.DEBUG)
+        for data in df.to_dict('records'):
+            # Convert all data to float (assuming all columns except 'Food' should be float)
+            data = {key: float(value) if key != 'Food' else value for key, value in data.items()}
+            if verbose:
+                logging.debug(f'Data to insert into "{table_name}": {data}')
+            rows.append(data)
+            self._pending += 1
+        # Set by units.to_sections
+        for nutrient, unit in df.attrs.get('units', {}).items():
+            self._units[(table_name, nutrient)] = unit
+
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def _ensure_table(self, table_name, columns):
+        '''
+        Create the table or add the missing columns, using the cached schema
+        so the table is only reflected the first time it is seen in the run.
+        '''
+        from sqlalchemy import inspect, MetaData, Table, Column, String, Float
+        if table_name not in self._columns:
+            inspector = inspect(self.connection)
+            if inspector.has_table(table_name):
+                self._columns[table_name] = [col['name'] for col in inspector.get_columns(table_name)]
+                logging.info(f'Table "{table_name}" already exists')
+            else:
+                # Define initial columns (assuming 'Food' as the primary key)
+                nutrient_columns = _missing_columns(['Food'], columns)
+                initial_columns = [Column('Food', String, primary_key=True)]
+                initial_columns += [Column(col, Float) for col in nutrient_columns]
+                Table(table_name, MetaData(), *initial_columns).create(self.connection)
+                self._columns[table_name] = ['Food'] + nutrient_columns
+                logging.info(f'Table "{table_name}" created successfully')
+                return
+
+        # Add every new column of the batch at once. With a constant default
+        # SQLite only changes the schema: existing rows read 0 without a
+        # backfill UPDATE rewriting the whole table
+        known_columns = self._columns[table_name]
+        new_columns = _missing_columns(known_columns, columns)
+        for col in new_columns:
+            self.connection.exec_driver_sql(f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" FLOAT DEFAULT 0')
+            known_columns.append(col)
+        if new_columns:
+            logging.info(f'Added {len(new_columns)} columns to table "{table_name}": {new_columns}')
+
+    def _record_count(self, table_name):
+        from sqlalchemy import MetaData, Table, Column, select, func
+        table = Table(table_name, MetaData(), *[Column(col) for col in self._columns[table_name]])
+        return self.connection.execute(select(func.count()).select_from(table)).scalar()
+
+    def _insert(self, table_name, rows):
+        from sqlalchemy.exc import SQLAlchemyError
+        batch_columns = list(dict.fromkeys(col for row in rows for col in row))
+        self._ensure_table(table_name, batch_columns)
+
+        # Every row of an executemany needs the same columns: the nutrients
+        # missing from a food are stored as NULL, not as the default 0
+        columns = self._columns[table_name]
+        if not set(batch_columns).issubset(columns):
+            # Spelled with another case than the column: "Sugars, total" goes to "Sugars, Total"
+            names = {col.lower(): col for col in columns}
+            rows = [_fold_case(row, names) for row in rows]
+
+        column_list = ', '.join(f'"{col}"' for col in columns)
+        placeholders = ', '.join('?' for _ in columns)
+        stmt = f'INSERT OR REPLACE INTO "{table_name}" ({column_list}) VALUES ({placeholders})'
+        parameters = [tuple(row.get(col) for col in columns) for row in rows]
+
+        if self.check == 'count':
+            count_before = self._record_count(table_name)
+        result = self.connection.exec_driver_sql(stmt, parameters)
+        if self.check == 'rowcount' and result.rowcount != -1 and result.rowcount < len(rows):
+            raise SQLAlchemyError(f'Only {result.rowcount} of {len(rows)} records inserted')
+        if self.check == 'count' and self._record_count(table_name) == count_before:
+            raise SQLAlchemyError('Record count did not change after insertion')
+
+    def _save_units(self, units):
+        self.connection.exec_driver_sql(UNITS_SCHEMA)
+        self.connection.exec_driver_sql(
+            f'INSERT OR REPLACE INTO "{UNITS_TABLE}" ("Section", "Nutrient", "Unit") VALUES (?, ?, ?)',
+            [(table_name, nutrient, unit) for (table_name, nutrient), unit in units.items()]
+            )
+
+    def flush(self):
+        '''
+        Insert every buffered row in a single transaction. If the batch fails,
+        every table is written again on its own, and the rows of a table that
+        fails again one at a time, so that a bad row only loses itself.
+        '''
+        if not self._pending:
+            return
+        from sqlalchemy.exc import SQLAlchemyError
+        if self.connection is None:
+            self._connect()
+
+        buffer, pending, units = self._buffer, self._pending, self._units
+        self._buffer, self._pending, self._units = {}, 0, {}
+        try:
+            self._write(buffer, units)
+            self.inserted += pending
+            logging.info(f'Inserted {pending} records into {len(buffer)} tables')
+            return
+        except SQLAlchemyError as e:
+            logging.error(f'Error inserting a batch of {pending} records, retrying table by table: {e}')
+
+        for table_name, rows in buffer.items():
+            try:
+                self._write({table_name: rows})
+                self.inserted += len(rows)
+                continue
+            except SQLAlchemyError as e:
+                logging.error(f'Error inserting {len(rows)} records into "{table_name}", retrying row by row: {e}')
+            for row in rows:
+                try:
+                    self._write({table_name: [row]})
+                    self.inserted += 1
+                except SQLAlchemyError as e:
+                    self.dropped.add(self._food_of(row))
+                    logging.error(f'Record dropped from "{table_name}": {row}: {e}')
+        if units:
+            try:
+                self._write({}, units)
+            except SQLAlchemyError as e:
+                logging.error(f'Units not saved: {e}')
+
+    @staticmethod
+    def _food_of(row):
+        return row.get('Food')
+
+    def _write(self, buffer, units=None):
+        '''
+        Insert the rows of buffer and save the units in one transaction,
+        rolled back on error.
+        '''
+        transaction = self.connection.begin()
+        try:
+            with metrics.timer('db_write'):
+                for table_name, rows in buffer.items():
+                    if rows:
+                        self._insert(table_name, rows)
+                if units:
+                    self._save_units(units)
+                transaction.commit()
+        except Exception:
+            transaction.rollback()
+            self._forget_schema()
+            raise
+
+    def _forget_schema(self):
+        '''
+        The rolled back columns have to be read again from the database.
+        '''
+        self._columns = {}
+
+    def close(self):
+        '''
+        Flush the remaining rows and release the connection.
+        '''
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+            self.engine.dispose()
+            self.connection = None
+
+def _missing_columns(known_columns, columns):
+    '''
+    Return the columns not in known_columns, each once, ignoring the case as
+    SQLite does for the column names.
+    '''
+    seen = {col.lower() for col in known_columns}
+    missing = []
+    for col in columns:
+        if col.lower() not in seen:
+            seen.add(col.lower())
+            missing.append(col)
+    return missing
+
+def _is_null(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def _fold_case(row, names):
+    '''
+    Rename the keys of a row to the columns of names ({lower case: column}).
+    A section pivoted from several foods has both spellings of a nutrient
+    in every row, one of them NaN: the value that is not null is kept.
+    '''
+    folded = {}
+    for key, value in row.items():
+        column = names[key.lower()]
+        if column not in folded or _is_null(folded[column]):
+            folded[column] = value
+    return folded
+
+# Normalized layout: a row per food, per nutrient of a section and per amount reported
+NORMALIZED_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS foods (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)',
+    'CREATE TABLE IF NOT EXISTS nutrients ('
+    'id INTEGER PRIMARY KEY, section TEXT NOT NULL, name TEXT NOT NULL, unit TEXT, UNIQUE (section, name))',
+    'CREATE INDEX IF NOT EXISTS nutrients_name ON nutrients (name)',
+    'CREATE TABLE IF NOT EXISTS food_nutrients ('
+    'food_id INTEGER NOT NULL REFERENCES foods (id), nutrient_id INTEGER NOT NULL REFERENCES nutrients (id), '
+    'value_mg REAL NOT NULL, below_detection INTEGER NOT NULL DEFAULT 0, '
+    'PRIMARY KEY (food_id, nutrient_id)) WITHOUT ROWID',
+    # "Which foods have nutrient X" (and "more than N mg of it") without a scan
+    'CREATE INDEX IF NOT EXISTS food_nutrients_nutrient ON food_nutrients (nutrient_id, value_mg)',
+    f'CREATE VIEW IF NOT EXISTS "{UNITS_TABLE}" AS '
+    'SELECT section AS "Section", name AS "Nutrient", unit AS "Unit" FROM nutrients',
+]
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def section_views(nutrients):
+    '''
+    Statements (re)creating a view per section of the normalized layout with
+    the columns of the wide tables: Food and one column per nutrient, in the
+    order they were first seen. nutrients holds (id, section, name) by id.
+    The names differing only in case share the column of the first spelling,
+    as in the wide tables.
+    '''
+    sections = {}
+    for nutrient_id, section, name in nutrients:
+        # {lower case name: (column, [ids])}
+        section_columns = sections.setdefault(section, {})
+        section_columns.setdefault(name.lower(), (name, []))[1].append(str(nutrient_id))
+    statements = []
+    for section, section_columns in sections.items():
+        columns = ''.join(
+            f', MAX(CASE WHEN food_nutrients.nutrient_id IN ({", ".join(column_ids)}) THEN food_nutrients.value_mg END) AS {_quote(name)}'
+            for name, column_ids in section_columns.values()
+            )
+        ids = ', '.join(nutrient_id for name, column_ids in section_columns.values() for nutrient_id in column_ids)
+        statements.append(f'DROP VIEW IF EXISTS {_quote(section)}')
+        statements.append(
+            f'CREATE VIEW {_quote(section)} AS SELECT foods.name AS "Food"{columns} '
+            'FROM food_nutrients JOIN foods ON foods.id = food_nutrients.food_id '
+            f'WHERE food_nutrients.nutrient_id IN ({ids}) '
+            'GROUP BY food_nutrients.food_id ORDER BY food_nutrients.food_id'
+            )
+    return statements
+
+class NormalizedWriter(SQLiteWriter):
+    '''
+    Writer for the normalized layout of food_components.db: foods, nutrients
+    (with their section and unit) and food_nutrients, one row per amount
+    reported, with value_mg in mg (kcal for energy, IU when it cannot be
+    converted) and the below-detection flag. New nutrients are new rows, so
+    the schema never changes while writing. Views named after the sections
+    reproduce the wide tables of SQLiteWriter; they are rebuilt at close.
+    Nutrients listed without an amount are not stored.
+    '''
+    def __init__(self, db_path='sqlite:///food_components.db', batch_size=200):
+        super().__init__(db_path, batch_size, check=None)
+        self._schema_ready = False
+        self._food_ids = {}
+        self._nutrient_ids = {}
+
+    def add(self, df, table_name):
+        '''
+        Buffer the amounts of a section DataFrame, flushing when the batch is full.
+        '''
+        # Set by units.to_sections
+        units = df.attrs.get('units', {})
+        below_detection = set(df.attrs.get('below_detection', ()))
+        nutrients = [col for col in df.columns if col != 'Food']
+        rows = self._buffer.setdefault(table_name, [])
+        for food, values in zip(df['Food'], df[nutrients].to_numpy(float)):
+            for nutrient, value in zip(nutrients, values):
+                if not math.isnan(value):
+                    rows.append((food, nutrient, units.get(nutrient), float(value), (food, nutrient) in below_detection))
+        self._pending += len(df)
+
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def _id(self, cache, key, select, insert, values):
+        '''
+        Return the id of a food or of a nutrient, adding it if it is new.
+        '''
+        if key not in cache:
+            row = self.connection.exec_driver_sql(select, key).fetchone()
+            cache[key] = row[0] if row else self.connection.exec_driver_sql(insert, values).lastrowid
+        return cache[key]
+
+    def _insert(self, table_name, rows):
+        from sqlalchemy.exc import SQLAlchemyError
+        if not self._schema_ready:
+            for statement in NORMALIZED_SCHEMA:
+                self.connection.exec_driver_sql(statement)
+            self._schema_ready = True
+
+        parameters = []
+        for food, nutrient, unit, value, below_detection in rows:
+            food_id = self._id(
+                self._food_ids, (food,),
+                'SELECT id FROM foods WHERE name = ?', 'INSERT INTO foods (name) VALUES (?)', (food,)
+                )
+            nutrient_id = self._id(
+                self._nutrient_ids, (table_name, nutrient),
+                'SELECT id FROM nutrients WHERE section = ? AND name = ?',
+                'INSERT INTO nutrients (section, name, unit) VALUES (?, ?, ?)', (table_name, nutrient, unit)
+                )
+            parameters.append((food_id, nutrient_id, value, int(below_detection)))
+
+        result = self.connection.exec_driver_sql(
+            'INSERT OR REPLACE INTO food_nutrients (food_id, nutrient_id, value_mg, below_detection) VALUES (?, ?, ?, ?)',
+            parameters
+            )
+        if result.rowcount != -1 and result.rowcount < len(parameters):
+            raise SQLAlchemyError(f'Only {result.rowcount} of {len(parameters)} amounts inserted')
+
+    @staticmethod
+    def _food_of(row):
+        return row[0]
+
+    def _forget_schema(self):
+        '''
+        The ids added by a rolled back batch do not exist anymore.
+        '''
+        self._schema_ready = False
+        self._food_ids = {}
+        self._nutrient_ids = {}
+
+    def _create_views(self):
+        '''
+        (Re)create the section views.
+        '''
+        nutrients = self.connection.exec_driver_sql('SELECT id, section, name FROM nutrients ORDER BY id').fetchall()
+        statements = section_views(nutrients)
+        for statement in statements:
+            self.connection.exec_driver_sql(statement)
+        logging.info(f'Created {len(statements) // 2} section views')
+
+    def close(self):
+        '''
+        Flush the remaining rows, rebuild the section views and release the connection.
+        '''
+        from sqlalchemy.exc import SQLAlchemyError
+        self.flush()
+        if self.connection is not None and self._schema_ready:
+            try:
+                with self.connection.begin():
+                    self._create_views()
+            except SQLAlchemyError as e:
+                logging.error(f'Section views not created: {e}')
+        super().close()
+
+class CSVWriter:
+    '''
+    Append-only writer for food_components.csv. Rows are buffered and appended
+    in batches; when new columns appear mid-run they are added at the end of
+    the header, and the file is rewritten once, at close, so that the header
+    matches the longest rows.
+    '''
+    def __init__(self, file_path, batch_size=200):
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.columns = []
+        self._header_columns = 0
+        self._buffer = []
+        if os.path.exists(file_path):
+            with open(file_path, newline='') as file:
+                self.columns = next(csv.reader(file), [])
+            self._header_columns = len(self.columns)
+
+    def add(self, df):
+        '''
+        Buffer the rows of a DataFrame, flushing when the batch is full.
+        '''
+        self._buffer.extend(df.to_dict('records'))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    @staticmethod
+    def _format(value):
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return ''
+        return value
+
+    def flush(self):
+        '''
+        Append the buffered rows to the end of the file.
+        '''
+        if not self._buffer:
+            return
+        for row in self._buffer:
+            for col in row:
+                if col not in self.columns:
+                    self.columns.append(col)
+
+        with metrics.timer('csv_write'), open(self.file_path, 'a', newline='') as file:
+            writer = csv.writer(file)
+            if self._header_columns == 0:
+                writer.writerow(self.columns)
+                self._header_columns = len(self.columns)
+            writer.writerows([self._format(row.get(col)) for col in self.columns] for row in self._buffer)
+        self._buffer = []
+
+    def close(self):
+        '''
+        Flush the remaining rows and, if the columns grew, rewrite the header
+        in a single pass, padding the shorter rows.
+        '''
+        self.flush()
+        if len(self.columns) == self._header_columns:
+            return
+
+        temporary_path = self.file_path + '.tmp'
+        with open(self.file_path, newline='') as source, open(temporary_path, 'w', newline='') as target:
+            reader = csv.reader(source)
+            writer = csv.writer(target)
+            next(reader, None)
+            writer.writerow(self.columns)
+            for row in reader:
+                writer.writerow(row + [''] * (len(self.columns) - len(row)))
+        os.replace(temporary_path, self.file_path)
+        self._header_columns = len(self.columns)
+        logging.info(f'Rewrote the header of "{self.file_path}" with {len(self.columns)} columns')
+
+class ResultWriter:
+    '''
+    Funnel the pages extracted by several workers to a single thread,
+    the only one allowed to touch the .db and .csv files of the run.
+    The amounts of the pages are kept as units.Amount records and turned
+    into section DataFrames every pages_per_batch pages, and every batch
+    is committed to both files before its pages are acknowledged to the
+    callbacks given to save. layout selects the SQLiteWriter ('wide', a
+    table per section) or the NormalizedWriter ('normalized').
+    '''
+    def __init__(self, folder_name, max_pending=1000, batch_size=200, layout='wide', pages_per_batch=20):
+        self.folder_name = folder_name
+        self.pages_per_batch = pages_per_batch
+        self.written = 0
+        db_writer = NormalizedWriter if layout == 'normalized' else SQLiteWriter
+        self.db = db_writer(
+            'sqlite:///' + folder_name + '/food_components_' + folder_name.split('/')[-1] + '.db',
+            batch_size=batch_size
+            )
+        self.csv = CSVWriter(folder_name + '/food_components_' + folder_name.split('/')[-1] + '.csv', batch_size=batch_size)
+        self._amounts = []
+        self._pages = []
+        # Pages whose rows were lost since the last sync
+        self._lost = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name='writer', daemon=True)
+        self._thread.start()
+
+    def save(self, amounts, written=None):
+        '''
+        Queue the amounts of a page for writing. Blocks when the writer is too far behind.
+        written, if given, is called by the writer thread once the batch of
+        the page is committed, as written(food, None), or once its rows are
+        lost, as written(food, error).
+        '''
+        self._queue.put((amounts, written))
+
+    def _write_batch(self):
+        '''
+        Turn the buffered amounts into one DataFrame per section, write and
+        commit them, then acknowledge the pages of the batch.
+        '''
+        import units
+        if not self._pages:
+            return
+        amounts, pages = self._amounts, self._pages
+        self._amounts, self._pages = [], []
+        error = None
+        try:
+            with metrics.timer('unit_conversion'):
+                normalized = units.normalize(units.amounts_to_long(amounts))
+            with metrics.timer('to_dataframes'):
+                sections = units.to_sections(normalized)
+            for table_name, df in sections.items():
+                self.db.add(df, table_name)
+                self.csv.add(df)
+            self.db.flush()
+            self.csv.flush()
+        except Exception as e:
+            error = str(e)
+            logging.error(f'Error writing a batch of {len(pages)} pages: {e}')
+        dropped, self.db.dropped = self.db.dropped, set()
+
+        for food, written in pages:
+            page_error = error
+            if page_error is None and food in dropped:
+                page_error = 'rows not saved in the database'
+            if page_error is None:
+                self.written += 1
+            else:
+                self._lost += 1
+            if written is not None:
+                try:
+                    written(food, page_error)
+                except Exception as e:
+                    logging.error(f'Acknowledgement of "{food}" failed: {e}')
+
+    def sync(self):
+        '''
+        Wait until every page saved so far is written and committed. Return
+        True if they all were, False if the rows of a page saved since the
+        previous sync were lost (the callbacks given to save tell which).
+        '''
+        written = threading.Event()
+        self._queue.put(written)
+        written.wait()
+        return written.lost == 0
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if isinstance(item, threading.Event):
+                self._write_batch()
+                item.lost, self._lost = self._lost, 0
+                item.set()
+                continue
+            amounts, written = item
+            self._amounts += amounts
+            self._pages.append((amounts[0].food if amounts else None, written))
+            if len(self._pages) >= self.pages_per_batch:
+                self._write_batch()
+        self._write_batch()
+        self.db.close()
+        self.csv.close()
+
+    def close(self):
+        '''
+        Write everything still queued and stop the writer thread.
+        '''
+        self._queue.put(None)
+        self._thread.join()
+        logging.info(f'Result writer closed after {self.written} pages')